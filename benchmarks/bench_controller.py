@@ -0,0 +1,143 @@
+'''
+What is this used for?
+1. Offline benchmark of the controller's packet-in path (no Mininet or root needed):
+   the packet-in event handler with its admission queue, then SDNController.handle_packet_in
+2. Feeds synthetic packet-in streams (ARP, allowed IPv4, denied IPv4, unknown MACs) to fake datapaths
+3. Reports packet-ins/s, p50/p99 handler latency and flow-mods emitted at 10, 100 and 1000 hosts
+
+Run from the project directory:
+    python3 benchmarks/bench_controller.py [packet-ins per stream]
+'''
+
+# import libraries
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'controller'))
+
+from ryu.controller import ofp_event
+from ryu.lib.packet import packet, ethernet, arp, ipv4, tcp
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+import simple_switch_stp_13
+from fake_datapath import FakeDatapath, FakeContext
+
+HOST_COUNTS = (10, 100, 1000)
+NUM_SWITCHES = 4            # linear chain, hosts spread round-robin
+PEERS_PER_HOST = 2          # allowed dependencies of every host
+PACKETS_PER_STREAM = 5000
+UPLINK_PORT_BASE = 1000     # inter-switch ports are numbered from here, host ports from 1
+SEED = 1
+
+# function to get the MAC and IP address of host number i
+def host_addresses(i):
+    return f"00:00:00:{(i >> 16) & 0xff:02x}:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}", f"10.{(i >> 16) & 0xff}.{(i >> 8) & 0xff}.{i & 0xff}"
+
+# function to build an IPv4/TCP frame between two MAC addresses
+def ipv4_frame(src_mac, dst_mac):
+    pkt = packet.Packet()
+    pkt.add_protocol(ethernet.ethernet(ethertype=0x0800, dst=dst_mac, src=src_mac))
+    pkt.add_protocol(ipv4.ipv4(src='10.0.0.1', dst='10.0.0.2', proto=6))
+    pkt.add_protocol(tcp.tcp(src_port=40000, dst_port=5000))
+    pkt.serialize()
+    return bytes(pkt.data)
+
+# function to build a broadcast ARP request
+def arp_frame(src_mac, src_ip, dst_ip):
+    pkt = packet.Packet()
+    pkt.add_protocol(ethernet.ethernet(ethertype=0x0806, dst='ff:ff:ff:ff:ff:ff', src=src_mac))
+    pkt.add_protocol(arp.arp(opcode=arp.ARP_REQUEST, src_mac=src_mac, src_ip=src_ip,
+                             dst_mac='00:00:00:00:00:00', dst_ip=dst_ip))
+    pkt.serialize()
+    return bytes(pkt.data)
+
+# function to wrap a frame into the packet-in event a switch would cause
+def packet_in_event(datapath, in_port, frame):
+    msg = ofproto_v1_3_parser.OFPPacketIn(
+        datapath, buffer_id=ofproto_v1_3.OFP_NO_BUFFER, total_len=len(frame), reason=0,
+        table_id=0, cookie=0, match=ofproto_v1_3_parser.OFPMatch(in_port=in_port), data=frame)
+    return ofp_event.EventOFPPacketIn(msg)
+
+# function to create a controller with switches, links, hosts and policy set up like a running network
+def build_controller(num_hosts):
+    simple_switch_stp_13.SNAPSHOT_INTERVAL = 0     # no state file reads/writes
+    app = simple_switch_stp_13.SDNController(wsgi=FakeContext(), stplib=FakeContext())
+    app.logger.disabled = True
+
+    datapaths = {}
+    for dpid in range(1, NUM_SWITCHES + 1):
+        datapaths[dpid] = FakeDatapath(dpid)
+        app.datapaths[dpid] = datapaths[dpid]
+        app.topology.add_switch(dpid)
+    for dpid in range(1, NUM_SWITCHES):
+        app.topology.add_link(dpid, UPLINK_PORT_BASE + 1, dpid + 1, UPLINK_PORT_BASE)
+        app.topology.add_link(dpid + 1, UPLINK_PORT_BASE, dpid, UPLINK_PORT_BASE + 1)
+
+    hosts = []
+    for i in range(num_hosts):
+        mac, ip = host_addresses(i + 1)
+        hosts.append({'host': f'h{i + 1}', 'host_mac': mac, 'dpid': format(i % NUM_SWITCHES + 1, 'x'),
+                      'port': i // NUM_SWITCHES + 1, 'ip': ip})
+    app.set_hosts(hosts)
+    app.set_policy(dict((f'h{i + 1}', [f'h{(i + k) % num_hosts + 1}' for k in range(1, PEERS_PER_HOST + 1)])
+                        for i in range(num_hosts)))
+    return app, datapaths, hosts
+
+# function to build a stream of packet-in events of one kind
+def build_stream(kind, app, datapaths, hosts, count, rng):
+    events = []
+    for _ in range(count):
+        src = rng.choice(hosts)
+        datapath = datapaths[int(src['dpid'], 16)]
+        if kind == 'arp':
+            dst = rng.choice(hosts)
+            frame = arp_frame(src['host_mac'], src['ip'], dst['ip'])
+        elif kind == 'allowed':
+            dst_name = rng.choice(sorted(app.policy.allowed_peers[src['host']]))
+            frame = ipv4_frame(src['host_mac'], app.policy.hosts_info[dst_name]['mac'])
+        elif kind == 'denied':
+            dst = rng.choice(hosts)
+            while app.policy.is_allowed(src['host'], dst['host']) or dst is src:
+                dst = rng.choice(hosts)
+            frame = ipv4_frame(src['host_mac'], dst['host_mac'])
+        else:   # unknown source MAC
+            unknown_mac, _ = host_addresses(0x800000 + rng.randrange(0xffff))
+            frame = ipv4_frame(unknown_mac, src['host_mac'])
+        events.append(packet_in_event(datapath, src['port'], frame))
+    return events
+
+# function to feed a stream to the controller; returns (packet-ins/s, p50 us, p99 us, flow-mods emitted)
+def run_stream(app, datapaths, events):
+    flow_mods_before = sum(datapath.count('OFPFlowMod') for datapath in datapaths.values())
+    latencies = []
+    start = time.perf_counter()
+    for ev in events:
+        t0 = time.perf_counter()
+        # same path as a switch's packet-in: admission (coalescing, queue bounds) before the handler
+        app._packet_in_handler(ev)
+        app.drain_admission_queues()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    flow_mods = sum(datapath.count('OFPFlowMod') for datapath in datapaths.values()) - flow_mods_before
+    return (len(events) / elapsed,
+            latencies[len(latencies) // 2] * 1e6,
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6,
+            flow_mods)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else PACKETS_PER_STREAM
+    print(f"{'hosts':>6} {'stream':>8} {'packet-ins/s':>13} {'p50 us':>8} {'p99 us':>8} {'flow-mods':>10}")
+    for num_hosts in HOST_COUNTS:
+        for kind in ('arp', 'allowed', 'denied', 'unknown'):
+            rng = random.Random(SEED)
+            app, datapaths, hosts = build_controller(num_hosts)
+            events = build_stream(kind, app, datapaths, hosts, count, rng)
+            rate, p50, p99, flow_mods = run_stream(app, datapaths, events)
+            print(f"{num_hosts:>6} {kind:>8} {rate:>13.0f} {p50:>8.1f} {p99:>8.1f} {flow_mods:>10}")
+
+if __name__ == "__main__":
+    main()
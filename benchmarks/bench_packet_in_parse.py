@@ -0,0 +1,119 @@
+'''
+What is this used for?
+1. Microbenchmark of packet-in parsing: full ryu Packet decode vs Ethernet header fast path
+2. Measures SDNController.handle_packet_in throughput with each parser (no Mininet needed)
+3. Measures the whole per packet-in cost under ryu-manager: the controller plus Ryu's topology app
+   (ryu.topology.switches, which gets every packet-in too), with its host discovery vs trimmed to LLDP
+
+Run from the project directory:
+    python3 benchmarks/bench_packet_in_parse.py
+'''
+
+# import libraries
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'controller'))
+
+from ryu.controller import ofp_event
+from ryu.controller.handler import register_instance
+from ryu.lib.packet import packet, ethernet, ipv4, tcp
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+from ryu.topology.switches import Switches, PortState
+
+import simple_switch_stp_13
+from packet_fastpath import parse_ethernet_header
+from fake_datapath import FakeDatapath, FakeContext
+
+ROUNDS = 20000
+SWITCH_PORTS = 8    # ports of the switch as known to Ryu's topology app
+
+# function to build an IPv4/TCP frame between two hosts
+def build_frame(src_mac, dst_mac):
+    pkt = packet.Packet()
+    pkt.add_protocol(ethernet.ethernet(ethertype=0x0800, dst=dst_mac, src=src_mac))
+    pkt.add_protocol(ipv4.ipv4(src='10.0.0.1', dst='10.0.0.2', proto=6))
+    pkt.add_protocol(tcp.tcp(src_port=40000, dst_port=5000))
+    pkt.serialize()
+    return bytes(pkt.data) + b'\x00' * 64
+
+# function to parse the Ethernet header the way the controller used to (full decode)
+def full_parse(data):
+    eth = packet.Packet(data).get_protocols(ethernet.ethernet)[0]
+    return eth.dst, eth.src, eth.ethertype
+
+# function to build Ryu's topology app as ryu-manager runs it (--observe-links), knowing the switch and its ports
+def topology_app(datapath):
+    switches = Switches()
+    register_instance(switches)     # event handlers, as ryu-manager registers them
+    switches.link_discovery = True
+    switches.dps[datapath.id] = datapath
+    switches.port_state[datapath.id] = PortState()
+    for port_no in range(1, SWITCH_PORTS + 1):
+        switches.port_state[datapath.id].add(port_no, ofproto_v1_3_parser.OFPPort(
+            port_no=port_no, hw_addr=f'02:00:00:00:00:{port_no:02x}', name=f's1-eth{port_no}'.encode(),
+            config=0, state=0, curr=0, advertised=0, supported=0, peer=0, curr_speed=0, max_speed=0))
+    return switches
+
+# function to measure packet-in throughput (packet-ins per second) with the given parser; with topology set to
+# 'ryu' every packet-in also goes through the packet-in handlers of Ryu's topology app, with 'trimmed' through
+# what is left of them after SDNController.trim_topology_app
+def handler_throughput(parser_func, frame, topology=None):
+    simple_switch_stp_13.parse_ethernet_header = parser_func
+    simple_switch_stp_13.SNAPSHOT_INTERVAL = 0     # no state file reads/writes
+    app = simple_switch_stp_13.SDNController(wsgi=FakeContext(), stplib=FakeContext())
+    datapath = FakeDatapath(1)
+    app.datapaths[1] = datapath
+    app.topology.add_switch(1)
+    app.set_hosts([
+        {'host': 'h1', 'host_mac': '00:00:00:00:00:01', 'dpid': '1', 'port': 1},
+        {'host': 'h2', 'host_mac': '00:00:00:00:00:02', 'dpid': '1', 'port': 2},
+    ])
+    app.add_communication('h1', ['h2'])
+    app.logger.disabled = True
+
+    msg = ofproto_v1_3_parser.OFPPacketIn(
+        datapath, buffer_id=ofproto_v1_3.OFP_NO_BUFFER, total_len=len(frame), reason=0,
+        table_id=0, cookie=0, match=ofproto_v1_3_parser.OFPMatch(in_port=1), data=frame)
+    ev = ofp_event.EventOFPPacketIn(msg)
+
+    handlers = []
+    if topology is not None:
+        switches = topology_app(datapath)
+        if topology == 'trimmed':
+            app.trim_topology_app(switches)
+        handlers = switches.event_handlers[ofp_event.EventOFPPacketIn]
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        app.handle_packet_in(ev)
+        for handler in handlers:
+            handler(ev)
+    return ROUNDS / (time.perf_counter() - start)
+
+def main():
+    frame = build_frame('00:00:00:00:00:01', '00:00:00:00:00:02')
+    assert full_parse(frame) == parse_ethernet_header(frame)
+
+    full_us = timeit.timeit(lambda: full_parse(frame), number=ROUNDS) / ROUNDS * 1e6
+    fast_us = timeit.timeit(lambda: parse_ethernet_header(frame), number=ROUNDS) / ROUNDS * 1e6
+    print(f"parse, full decode:        {full_us:8.2f} us/packet")
+    print(f"parse, header fast path:   {fast_us:8.2f} us/packet  ({full_us / fast_us:.1f}x faster)")
+
+    full_rate = handler_throughput(full_parse, frame)
+    fast_rate = handler_throughput(parse_ethernet_header, frame)
+    print(f"handle_packet_in, full decode:      {full_rate:10.0f} packet-ins/s")
+    print(f"handle_packet_in, header fast path: {fast_rate:10.0f} packet-ins/s  ({fast_rate / full_rate:.2f}x)")
+
+    # what ryu-manager actually runs per packet-in, including Ryu's topology app
+    base_rate = handler_throughput(full_parse, frame, 'ryu')
+    fast_rate = handler_throughput(parse_ethernet_header, frame, 'ryu')
+    trimmed_rate = handler_throughput(parse_ethernet_header, frame, 'trimmed')
+    print(f"+ Ryu topology app, full decode:    {base_rate:10.0f} packet-ins/s")
+    print(f"+ Ryu topology app, fast path:      {fast_rate:10.0f} packet-ins/s  ({fast_rate / base_rate:.2f}x)")
+    print(f"+ topology app trimmed, fast path:  {trimmed_rate:10.0f} packet-ins/s  ({trimmed_rate / base_rate:.2f}x)")
+
+if __name__ == "__main__":
+    main()
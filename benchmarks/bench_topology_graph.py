@@ -0,0 +1,82 @@
+'''
+What is this used for?
+1. Benchmark of TopologyGraph path cache updates during link discovery (no ryu or Mininet needed)
+2. Builds RandomTopo-shaped graphs (switch chain plus random extra links) of up to several hundred switches,
+   adding the link ends in random order the way LLDP discovers them, then removing some links again
+3. Reports the time per link change next to one full all-pairs recompute, and checks the cache against it
+
+Run from the project directory:
+    python3 benchmarks/bench_topology_graph.py
+'''
+
+# import libraries
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'controller'))
+
+from topology_graph import TopologyGraph
+
+# (switches, probability of an extra link between non-consecutive switches), as passed to RandomTopo
+SIZES = ((100, 0.055), (200, 0.03), (400, 0.015))
+REMOVED_LINKS = 50
+SEED = 1
+
+# function to draw the switch links of a RandomTopo-style topology (ports numbered per switch)
+def random_links(num_switches, links_prob):
+    pairs = [(i, i + 1) for i in range(1, num_switches)]
+    pairs += [(i, j) for i in range(1, num_switches + 1) for j in range(i + 2, num_switches + 1)
+              if random.random() < links_prob]
+    next_port = dict((dpid, 1) for dpid in range(1, num_switches + 1))
+    links = []
+    for a, b in pairs:
+        links.append((a, next_port[a], b, next_port[b]))
+        next_port[a] += 1
+        next_port[b] += 1
+    return links
+
+# function to compute every shortest path from scratch (what the cache saves)
+def full_recompute(graph):
+    paths = {}
+    for src in graph.adjacency:
+        dist, previous = graph._bfs(src)
+        paths[src] = dict((dst, graph._path(previous, dst)) for dst in dist)
+    return paths
+
+def main():
+    random.seed(SEED)
+    for num_switches, links_prob in SIZES:
+        links = random_links(num_switches, links_prob)
+        link_ends = [(a, a_port, b, b_port) for a, a_port, b, b_port in links]
+        link_ends += [(b, b_port, a, a_port) for a, a_port, b, b_port in links]
+        random.shuffle(link_ends)
+
+        graph = TopologyGraph()
+        for dpid in range(1, num_switches + 1):
+            graph.add_switch(dpid)
+        start = time.perf_counter()
+        for src_dpid, src_port, dst_dpid, dst_port in link_ends:
+            graph.add_link(src_dpid, src_port, dst_dpid, dst_port)
+        add_time = time.perf_counter() - start
+
+        removed = random.sample(links, REMOVED_LINKS)
+        start = time.perf_counter()
+        for a, a_port, b, b_port in removed:
+            graph.remove_link(a, a_port)
+            graph.remove_link(b, b_port)
+        remove_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = full_recompute(graph)
+        full_time = time.perf_counter() - start
+        assert graph.paths == expected
+
+        print(f"{num_switches:4d} switches, {len(links):5d} links: "
+              f"add {add_time:6.2f} s ({add_time / len(links) * 1e3:6.2f} ms/link), "
+              f"remove {remove_time / REMOVED_LINKS * 1e3:6.2f} ms/link, "
+              f"full recompute {full_time * 1e3:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
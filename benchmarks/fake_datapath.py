@@ -0,0 +1,40 @@
+'''
+What is this used for?
+1. Stand-ins for a switch connection (datapath) and the contexts the controller app expects
+2. Lets benchmarks run SDNController without Mininet, Open vSwitch or root
+'''
+
+# import libraries
+import itertools
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+# class for a switch stand-in that records the messages the controller sends
+class FakeDatapath:
+    _xids = itertools.count(1)
+
+    def __init__(self, dpid):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+        self.sent = 0
+        self.sent_by_type = {}  # message class name -> count
+
+    def send_msg(self, msg):
+        self.sent += 1
+        name = type(msg).__name__
+        self.sent_by_type[name] = self.sent_by_type.get(name, 0) + 1
+
+    def set_xid(self, msg):
+        msg.set_xid(next(self._xids))
+
+    # function to get the number of messages of one type sent so far (e.g. 'OFPFlowMod')
+    def count(self, name):
+        return self.sent_by_type.get(name, 0)
+
+# class for the WSGI/stplib contexts the controller expects
+class FakeContext:
+    def register(self, *args, **kwargs):
+        pass
+
+    def set_config(self, config):
+        pass
@@ -0,0 +1,158 @@
+'''
+What is this used for?
+1. Collects controller statistics (packet-in rates, handler latency, flow-mods, drops, ARP floods)
+2. Keeps the latest flow/port/meter counters polled from every switch
+3. Renders everything as JSON or Prometheus text format
+'''
+
+import time
+from bisect import bisect_left
+
+RATE_MIN_INTERVAL = 1.0     # seconds; packet-in rates are recomputed (by polls or stats requests) at most this often
+
+# class for a fixed-bucket latency histogram (seconds)
+class LatencyHistogram:
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)    # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    # function to record one observation
+    def observe(self, seconds):
+        self.counts[bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    # function to get cumulative (upper bound, count) pairs as used by Prometheus
+    def cumulative(self):
+        total = 0
+        buckets = []
+        for bound, count in zip(self.BUCKETS + (float('inf'),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in self.cumulative()}
+        }
+
+# class for all controller statistics
+class ControllerStats:
+    COUNTERS = {
+        'flow_mods': 'Flow-mods (adds and deletes) sent to switches',
+        'dropped': 'Packet-ins dropped because the traffic is not allowed or unknown',
+        'arp_floods': 'ARP packets flooded by the controller',
+        'arp_replies': 'ARP requests answered by the controller',
+        'elephant_reroutes': 'Elephant flows moved to a less loaded path'
+    }
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.packet_ins = {}        # dpid -> packet-ins handled
+        self.packet_in_rates = {}   # dpid -> packet-ins per second between the last two rate updates
+        self._rate_marks = {}       # dpid -> (time, packet-ins) at the last rate update
+        self.packet_in_latency = LatencyHistogram()
+        self.switches = {}          # dpid -> latest polled flow/port/meter counters
+
+    # function to increment a controller counter
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    # function to record a handled packet-in and how long the handler took
+    def observe_packet_in(self, dpid, seconds):
+        self.packet_ins[dpid] = self.packet_ins.get(dpid, 0) + 1
+        self.packet_in_latency.observe(seconds)
+
+    # function to recompute packet-in rates since the previous update (skipped if that was too recent)
+    def update_rates(self, now=None):
+        now = time.time() if now is None else now
+        for dpid, total in self.packet_ins.items():
+            last_time, last_total = self._rate_marks.get(dpid, (self.started, 0))
+            if now - last_time >= RATE_MIN_INTERVAL:
+                self.packet_in_rates[dpid] = (total - last_total) / (now - last_time)
+                self._rate_marks[dpid] = (now, total)
+
+    # function to store polled counters of a switch (section is 'flows', 'ports' or 'meters')
+    def set_switch_stats(self, dpid, section, values):
+        self.switches.setdefault(dpid, {})[section] = values
+
+    # function to forget a disconnected switch
+    def remove_switch(self, dpid):
+        self.switches.pop(dpid, None)
+        self.packet_ins.pop(dpid, None)
+        self.packet_in_rates.pop(dpid, None)
+        self._rate_marks.pop(dpid, None)
+
+    def to_dict(self, extra=None):
+        self.update_rates()     # also without stats polling
+        stats = {
+            'uptime': time.time() - self.started,
+            'counters': dict(self.counters),
+            'packet_ins': {str(dpid): count for dpid, count in self.packet_ins.items()},
+            'packet_in_rates': {str(dpid): rate for dpid, rate in self.packet_in_rates.items()},
+            'packet_in_latency_seconds': self.packet_in_latency.to_dict(),
+            'switches': {str(dpid): values for dpid, values in self.switches.items()}
+        }
+        stats.update(extra or {})
+        return stats
+
+    # function to render the statistics in Prometheus text exposition format
+    # extra_metrics: name -> (type, help text, [(labels, value)]) for metrics kept outside this class
+    def to_prometheus(self, extra_metrics=None):
+        self.update_rates()     # also without stats polling
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        for counter, value in self.counters.items():
+            metric(f"ngn_controller_{counter}_total", 'counter', self.COUNTERS[counter], [({}, value)])
+        metric('ngn_packet_in_total', 'counter', 'Packet-ins handled per switch',
+               [({'dpid': dpid}, count) for dpid, count in self.packet_ins.items()])
+        metric('ngn_packet_in_rate', 'gauge', 'Packet-ins per second per switch',
+               [({'dpid': dpid}, rate) for dpid, rate in self.packet_in_rates.items()])
+
+        latency = self.packet_in_latency
+        name = 'ngn_packet_in_latency_seconds'
+        lines.append(f"# HELP {name} Packet-in handler latency")
+        lines.append(f"# TYPE {name} histogram")
+        for bound, count in latency.cumulative():
+            le = '+Inf' if bound == float('inf') else str(bound)
+            lines.append(f'{name}_bucket{{le="{le}"}} {count}')
+        lines.append(f"{name}_sum {latency.sum}")
+        lines.append(f"{name}_count {latency.count}")
+
+        flows = [(dpid, values['flows']) for dpid, values in self.switches.items() if 'flows' in values]
+        metric('ngn_switch_flows', 'gauge', 'Flow table entries per switch',
+               [({'dpid': dpid}, stats['flow_count']) for dpid, stats in flows])
+        # sums over the installed flows: they go down when flows expire, so not counters
+        metric('ngn_switch_flow_packets', 'gauge', 'Packets matched by the installed flows per switch',
+               [({'dpid': dpid}, stats['packet_count']) for dpid, stats in flows])
+        metric('ngn_switch_flow_bytes', 'gauge', 'Bytes matched by the installed flows per switch',
+               [({'dpid': dpid}, stats['byte_count']) for dpid, stats in flows])
+
+        ports = [(dpid, port, counters) for dpid, values in self.switches.items()
+                 for port, counters in values.get('ports', {}).items()]
+        for counter in ('rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes', 'rx_dropped', 'tx_dropped', 'rx_errors', 'tx_errors'):
+            metric(f"ngn_port_{counter}_total", 'counter', f"Port {counter.replace('_', ' ')}",
+                   [({'dpid': dpid, 'port': port}, counters[counter]) for dpid, port, counters in ports])
+
+        meters = [(dpid, meter_id, counters) for dpid, values in self.switches.items()
+                  for meter_id, counters in values.get('meters', {}).items()]
+        metric('ngn_meter_dropped_packets_total', 'counter', 'Packets dropped by meter bands',
+               [({'dpid': dpid, 'meter': meter_id}, counters['dropped_packets']) for dpid, meter_id, counters in meters])
+
+        for name, (metric_type, help_text, samples) in (extra_metrics or {}).items():
+            metric(name, metric_type, help_text, samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,59 @@
+'''
+What is this used for?
+1. Records per-packet controller decisions (timestamp, dpid, src, dst, verdict, detail) in a fixed-size ring
+   src/dst are always MAC addresses (None if unknown); anything else (host names, IPs) goes in detail
+2. The ring is preallocated; recording an event only stores references, no string formatting
+   (a (host, host) detail is kept as a tuple and rendered as "a -> b" when events are read or logged)
+3. Events are read back by sequence number (REST /events?since=) or passed to an optional sink (e.g. logging)
+'''
+
+import time
+
+# function to render an event detail for REST/log output (None stays None)
+def format_detail(detail):
+    if detail is None:
+        return None
+    if isinstance(detail, tuple):
+        return ' -> '.join(str(part) for part in detail)
+    return str(detail)
+
+# class for the in-memory ring of controller events
+class EventJournal:
+    def __init__(self, size=4096, sink=None):
+        self.size = size
+        self.sink = sink            # optional callable(seq, timestamp, dpid, src, dst, verdict, detail)
+        self.next_seq = 0           # sequence number of the next event
+        # one preallocated list per field; slot = seq % size
+        self.times = [0.0] * size
+        self.dpids = [None] * size
+        self.srcs = [None] * size
+        self.dsts = [None] * size
+        self.verdicts = [None] * size
+        self.details = [None] * size
+
+    # function to record an event (oldest events are overwritten once the ring is full)
+    def record(self, dpid, src, dst, verdict, detail=None):
+        seq = self.next_seq
+        slot = seq % self.size
+        now = time.time()
+        self.times[slot] = now
+        self.dpids[slot] = dpid
+        self.srcs[slot] = src
+        self.dsts[slot] = dst
+        self.verdicts[slot] = verdict
+        self.details[slot] = detail
+        self.next_seq = seq + 1
+        if self.sink is not None:
+            self.sink(seq, now, dpid, src, dst, verdict, detail)
+
+    # function to get the events with sequence number >= since that are still in the ring (at most limit)
+    def since(self, since=0, limit=None):
+        first = max(since, self.next_seq - self.size, 0)
+        last = self.next_seq if limit is None else min(self.next_seq, first + limit)
+        events = []
+        for seq in range(first, last):
+            slot = seq % self.size
+            events.append({'seq': seq, 'time': self.times[slot], 'dpid': self.dpids[slot],
+                           'src': self.srcs[slot], 'dst': self.dsts[slot], 'verdict': self.verdicts[slot],
+                           'detail': format_detail(self.details[slot])})
+        return events
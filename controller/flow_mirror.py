@@ -0,0 +1,81 @@
+'''
+What is this used for?
+1. Mirrors the flows the controller installed on each switch
+2. Kept accurate from flow-mods, deletes and FlowRemoved messages
+3. Lets the controller skip flow-mods for flows already present and report table occupancy
+'''
+
+# class for the per-switch mirror of installed flows
+class FlowMirror:
+    def __init__(self):
+        self.tables = {}    # dpid -> {(table id, priority, match key): (cookie, instructions key)}
+
+    # function to get a hashable key for an OFPMatch
+    @staticmethod
+    def match_key(match):
+        return tuple(sorted(match.items()))
+
+    # function to get a cheap hashable key for a flow's instructions (meter, actions, goto table)
+    @staticmethod
+    def instructions_key(actions, meter_id=None, goto_table=None):
+        return (meter_id,
+                tuple((type(action).__name__, getattr(action, 'port', None), getattr(action, 'group_id', None))
+                      for action in actions),
+                goto_table)
+
+    # function to check if an identical flow is already installed
+    def is_installed(self, dpid, table_id, priority, match, cookie, instructions_key):
+        entry = self.tables.get(dpid, {}).get((table_id, priority, self.match_key(match)))
+        return entry == (cookie, instructions_key)
+
+    # function to record an installed (or replaced) flow
+    def record(self, dpid, table_id, priority, match, cookie, instructions_key):
+        key = (table_id, priority, self.match_key(match))
+        self.tables.setdefault(dpid, {})[key] = (cookie, instructions_key)
+
+    # function to forget a flow the switch removed; returns its cookie (None if unknown)
+    # with a cookie, a flow reinstalled under another cookie since then is kept
+    def remove(self, dpid, table_id, priority, match, cookie=None):
+        table = self.tables.get(dpid, {})
+        key = (table_id, priority, self.match_key(match))
+        entry = table.get(key)
+        if entry is None or (cookie is not None and entry[0] != cookie):
+            return None
+        del table[key]
+        return entry[0]
+
+    # function to list the flows of a switch a non-strict OFPFC_DELETE would remove
+    def matching(self, dpid, cookie, cookie_mask, match_fields, table_id=None):
+        keys = []
+        for key, (flow_cookie, _) in self.tables.get(dpid, {}).items():
+            flow_table_id, _, flow_match = key
+            if table_id is not None and flow_table_id != table_id:
+                continue
+            if (flow_cookie & cookie_mask) != (cookie & cookie_mask):
+                continue
+            # the flow must match at least the fields of the delete
+            fields = dict(flow_match)
+            if all(fields.get(field) == value for field, value in match_fields.items()):
+                keys.append(key)
+        return keys
+
+    # function to forget the flows a non-strict OFPFC_DELETE removes
+    def remove_matching(self, dpid, cookie, cookie_mask, match_fields, table_id=None):
+        table = self.tables.get(dpid, {})
+        for key in self.matching(dpid, cookie, cookie_mask, match_fields, table_id):
+            del table[key]
+
+    # function to check if any flow of a switch matches on a field value
+    def uses_value(self, dpid, field, value):
+        for _, _, flow_match in self.tables.get(dpid, {}):
+            if (field, value) in flow_match:
+                return True
+        return False
+
+    # function to forget all flows of a switch (e.g. disconnected)
+    def clear(self, dpid):
+        self.tables.pop(dpid, None)
+
+    # function to get the number of flows installed on a switch
+    def occupancy(self, dpid):
+        return len(self.tables.get(dpid, {}))
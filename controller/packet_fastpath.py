@@ -0,0 +1,19 @@
+'''
+What is this used for?
+1. Reads the Ethernet header of a packet-in straight from the message buffer
+2. Avoids decoding every protocol layer when only src/dst/ethertype are needed
+'''
+
+import struct
+
+ETH_TYPE_IPV4 = 0x0800
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_LLDP = 0x88cc
+
+# destination MAC (6 bytes), source MAC (6 bytes), ethertype (2 bytes)
+_ETH_HEADER = struct.Struct('!6s6sH')
+
+# function to get (dst MAC, src MAC, ethertype) of a raw Ethernet frame
+def parse_ethernet_header(data):
+    dst, src, eth_type = _ETH_HEADER.unpack_from(data, 0)
+    return dst.hex(':'), src.hex(':'), eth_type
@@ -0,0 +1,58 @@
+'''
+What is this used for?
+1. Holds the registered hosts and the communication policy as immutable snapshots
+2. Every change builds a new snapshot with the next epoch; the controller swaps it in with one assignment
+3. Readers (packet-in handling) keep a consistent view without locks, even while REST calls change the policy
+'''
+
+from types import MappingProxyType
+
+# function to convert the host list sent by gui.py into ordered host info (order = cookie bit index)
+def parse_hosts(hosts):
+    hosts_info = {}
+    for host in hosts:
+        # Use base 16 for DPID conversion (hexadecimal)
+        hosts_info[host['host']] = {
+            'mac': host['host_mac'],
+            'dpid': int(host['dpid'], 16),
+            'port': host.get('port'),   # switch port the host is attached to (if known)
+            'ip': host.get('ip')
+        }
+    return hosts_info
+
+# class for one immutable version (epoch) of the host registration and communication policy
+class PolicySnapshot:
+    def __init__(self, epoch=0, base_epoch=0, hosts_info=None, communication_reqs=None):
+        hosts_info = hosts_info or {}
+        communication_reqs = communication_reqs or {}
+        self.epoch = epoch
+        self.base_epoch = base_epoch    # epoch of the host registration; flows of older epochs are stale
+        self.hosts_info = MappingProxyType(dict((name, MappingProxyType(dict(info)))
+                                                for name, info in hosts_info.items()))
+        self.mac_to_host = MappingProxyType(dict((info['mac'], name) for name, info in hosts_info.items()))
+        self.host_index = MappingProxyType(dict((name, index) for index, name in enumerate(hosts_info)))
+        # application communication requirements (host -> dependencies), registered hosts only
+        self.communication_reqs = MappingProxyType(dict(
+            (name, tuple(communication_reqs.get(name, ()))) for name in hosts_info))
+
+        # a dependency allows communication in both directions
+        allowed_peers = dict((name, set()) for name in hosts_info)
+        for name, dependencies in self.communication_reqs.items():
+            for dep in dependencies:
+                if dep in allowed_peers and dep != name:
+                    allowed_peers[name].add(dep)
+                    allowed_peers[dep].add(name)
+        self.allowed_peers = MappingProxyType(dict((name, frozenset(peers)) for name, peers in allowed_peers.items()))
+        self.allowed_pairs = frozenset((name, peer) for name, peers in allowed_peers.items() for peer in peers)
+
+    # function to get a snapshot with newly registered hosts and no communication allowed
+    def with_hosts(self, hosts):
+        return PolicySnapshot(self.epoch + 1, self.epoch + 1, parse_hosts(hosts))
+
+    # function to get a snapshot with the given communication requirements (host -> dependencies)
+    def with_requirements(self, communication_reqs):
+        return PolicySnapshot(self.epoch + 1, self.base_epoch, self.hosts_info, communication_reqs)
+
+    # function to check for allowed communication between hosts
+    def is_allowed(self, src_host_name, dst_host_name):
+        return (src_host_name, dst_host_name) in self.allowed_pairs
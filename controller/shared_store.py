@@ -0,0 +1,108 @@
+'''
+What is this used for?
+1. Small key-value store shared by the controller shards (one process, Unix socket)
+2. Shards publish their state (policy, discovered links) and fetch what other shards changed since a version
+3. Run as a script to start the store:  python3 controller/shared_store.py <socket path>
+
+Protocol: one JSON object per line in each direction
+    {"op": "put", "key": k, "value": v}     -> {"version": n}
+    {"op": "get", "key": k}                 -> {"version": n, "value": v}
+    {"op": "changes", "since": n}           -> {"version": n, "items": {key: value changed after since}}
+'''
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+# class for the store state (values with the global version at which they last changed)
+class Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.items = {}     # key -> (version, value)
+
+    def handle(self, request):
+        with self.lock:
+            op = request.get('op')
+            if op == 'put':
+                self.version += 1
+                self.items[request['key']] = (self.version, request['value'])
+                return {'version': self.version}
+            if op == 'get':
+                version, value = self.items.get(request['key'], (0, None))
+                return {'version': version, 'value': value}
+            if op == 'changes':
+                since = request.get('since', 0)
+                return {'version': self.version,
+                        'items': dict((key, value) for key, (version, value) in self.items.items() if version > since)}
+            return {'error': f"unknown op {op}"}
+
+# class for one client connection of the store server
+class StoreRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.store.handle(json.loads(line))
+            except (ValueError, KeyError) as e:
+                reply = {'error': str(e)}
+            self.wfile.write((json.dumps(reply) + '\n').encode())
+
+# class for the store server (one thread per connected shard)
+class StoreServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, StoreRequestHandler)
+        self.store = Store()
+
+# class for a shard's connection to the store (reconnects on the next call after an error)
+class StoreClient:
+    def __init__(self, path):
+        self.path = path
+        self.sock = None
+        self.file = None
+
+    def request(self, **request):
+        try:
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(self.path)
+                self.file = self.sock.makefile('rwb')
+            self.file.write((json.dumps(request) + '\n').encode())
+            self.file.flush()
+            reply = json.loads(self.file.readline())
+        except (OSError, ValueError):
+            self.close()
+            raise
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return reply
+
+    def put(self, key, value):
+        return self.request(op='put', key=key, value=value)['version']
+
+    def get(self, key):
+        return self.request(op='get', key=key)['value']
+
+    # function to get (current version, {key: value}) of the keys changed after version since
+    def changes(self, since):
+        reply = self.request(op='changes', since=since)
+        return reply['version'], reply['items']
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.file = None
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(1)
+    server = StoreServer(sys.argv[1])
+    print(f"Shared store listening on {sys.argv[1]}")
+    server.serve_forever()
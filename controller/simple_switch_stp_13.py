@@ -4,51 +4,235 @@ IMPORTANT ADDITIONS:
 - receive host data (MAC address, dpid) from gui
 - block all communication by default
 - add flows according to defined application communication requirements
+- install flows proactively on every switch along the path between allowed hosts
+- keep a switch topology graph with cached shortest paths; reroute host paths on link/port changes
+- cache denied traffic in short-lived drop flows so it stops reaching the controller
+- answer ARP requests for known hosts from the controller instead of flooding them
+- tag flows with cookies so a host's (or all) flows are removed with one masked delete per switch
+- expire policy flows with idle/hard timeouts and mirror the installed flows of every switch
+- rate limit packet-ins with OpenFlow meters and a bounded per-switch admission queue
+- read only the Ethernet header of packet-ins; full parsing only for ARP
+- report controller statistics and polled switch flow/port counters as JSON or Prometheus text
+- optionally flood along a controller-computed spanning tree (ALL groups) instead of waiting for STP
+- optionally spread host pairs over equal-cost paths, keeping redundant links in use (ecmp; select groups with multi-table)
+- accept the complete host dependency graph at once and only change the flows of added/removed pairs
+- snapshot the host/policy/path state to a file and restore it on startup (warm restart)
+- hold the policy in immutable epoch snapshots swapped atomically; flows of stale epochs are removed in the background
+- record per-packet decisions in a preallocated event ring (REST /events) instead of logging each packet
+- optionally run as one of several shards sharing policy and links through a local store
+- split the ACL (table 0, at the hosts' own switches) from per-destination forwarding (table 1)
+- move host pairs sending bulk traffic (elephant flows) onto less loaded equal-cost paths
+- report readiness (connected switches, STP port states) on REST /health
 '''
 
 # import ryu libraries
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import MAIN_DISPATCHER
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
 from ryu.lib import dpid as dpid_lib
 from ryu.lib import stplib
+from ryu.lib import hub
 from ryu.lib.packet import packet
 from ryu.lib.packet import ethernet
+from ryu.lib.packet import arp
 from ryu.app import simple_switch_13
 from ryu.app.wsgi import ControllerBase, WSGIApplication, route
-from ryu.lib.packet import ipv4, icmp
+from ryu.topology import event as topo_event
+from ryu.topology.switches import LLDPPacket
 
 # import other libraries
+import itertools
+import json
+import os
+import time
+from collections import deque
 from webob import Response
 
+# import controller modules
+from topology_graph import TopologyGraph
+from flow_mirror import FlowMirror
+from packet_fastpath import parse_ethernet_header, ETH_TYPE_ARP, ETH_TYPE_IPV4, ETH_TYPE_LLDP
+from controller_stats import ControllerStats
+from policy import PolicySnapshot, parse_hosts
+from event_journal import EventJournal, format_detail
+from traffic_monitor import TrafficMonitor
+from shared_store import StoreClient
+from state_snapshot import encode_snapshot, write_snapshot, read_snapshot
+
+# link discovery (LLDP) is needed to compute paths between switches; its host discovery is switched off
+# at startup (see trim_topology_app)
+app_manager.require_app('ryu.topology.switches')
+
+# flow cookies: | kind (8 bits) | policy epoch (16 bits) | host bitmap (40 bits) |
+# the kind tells which rule installed the flow; policy flows set one bit per host involved
+# (host index modulo 40) so all flows of a host can be deleted with one cookie-masked delete,
+# and carry the epoch of the policy they were installed under
+COOKIE_KIND_MASK = 0xff << 56
+COOKIE_KIND_POLICY = 0x01 << 56
+COOKIE_KIND_DROP = 0x02 << 56
+COOKIE_KIND_FLOOD = 0x03 << 56
+COOKIE_KIND_FORWARD = 0x04 << 56
+COOKIE_KIND_ELEPHANT = 0x05 << 56
+COOKIE_GENERATION_SHIFT = 40
+COOKIE_GENERATION_MASK = 0xffff << COOKIE_GENERATION_SHIFT
+COOKIE_HOST_BITS = 40
+
+# forwarding mode: 'stp' runs Ryu's STP (ports forward only after the listen/learn phases);
+# 'tree' floods along a spanning tree computed from the discovered topology, usable right away;
+# 'ecmp' floods like 'tree' and also spreads host pairs over all equal-cost paths (least loaded first)
+FORWARDING_MODE = 'tree'
+ECMP_MAX_PATHS = 16         # equal-cost paths considered per host pair (ecmp mode)
+ECMP_GROUP_BASE = 0x100     # first id of the SELECT groups spreading forwarding over equal-cost next hops (ecmp + multi-table)
+FLOOD_GROUP_ID = 1          # ALL group of each switch holding its tree and host ports
+FLOOD_PRIORITY = 20         # broadcast flows on inter-switch ports
+BROADCAST_MAC = 'ff:ff:ff:ff:ff:ff'
+
+# flow tables: with MULTI_TABLE, table 0 holds the ACL (allowed pairs, checked at the switch a host is attached to)
+# and table 1 forwards on eth_dst only along each host's shortest-path tree, so forwarding state is O(hosts)
+# per switch (in ecmp mode through a SELECT group over all equal-cost next hops); without it every switch on a
+# pair's path gets two exact eth_src/eth_dst flows
+MULTI_TABLE = True
+ACL_TABLE = 0
+FORWARDING_TABLE = 1
+TRANSIT_PRIORITY = 1        # traffic from other switches passed the ACL at its ingress switch
+FORWARDING_PRIORITY = 10
+
+POLICY_GC_INTERVAL = 2      # seconds between removals of flows installed under a stale host registration
+
+BARRIER_TIMEOUT = 5         # seconds to wait for switches to confirm deletions
+
+# policy (allowed host pair) flows
+POLICY_PRIORITY = 10
+POLICY_IDLE_TIMEOUT = 300   # seconds without traffic before a policy flow expires (0 = never)
+POLICY_HARD_TIMEOUT = 0     # seconds before a policy flow expires regardless of traffic (0 = never)
+
+# packet-in rate limiting
+PACKET_IN_METER_ID = 1
+PACKET_IN_METER_RATE = 1000     # packets per second each switch may send to the controller (0 = no meter)
+PACKET_IN_METER_BURST = 100     # packets
+ADMISSION_QUEUE_SIZE = 256      # packet-ins waiting per switch; excess ones are dropped
+
+# sharding: several controller processes, each handling the switches connected to it (set by network.py)
+SHARD_INDEX = int(os.environ.get('NGN_SHARD_INDEX', 0))
+SHARD_COUNT = int(os.environ.get('NGN_SHARD_COUNT', 1))
+STORE_PATH = os.environ.get('NGN_STORE_PATH', '/tmp/ngn_store.sock')
+STORE_SYNC_INTERVAL = 0.5   # seconds between exchanges with the shared store
+REMOTE_LINK_TIMEOUT = 15    # seconds a link from another shard's switch stays known without LLDP
+
+# state snapshot (warm restart)
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             f'controller_state_{SHARD_INDEX}.json' if SHARD_COUNT > 1 else 'controller_state.json')
+SNAPSHOT_INTERVAL = 5       # seconds between snapshots, written only if the state changed (0 = no snapshots)
+
+# event journal (per-packet decisions)
+JOURNAL_SIZE = 4096         # events kept in memory
+JOURNAL_LOG = False         # also write every event to the log (costs string formatting per packet)
+
+# statistics
+STATS_POLL_INTERVAL = 10    # seconds between flow/port/meter stats requests to every switch (0 = no polling)
+
+# elephant flows: pairs above the rate (measured at the sender's switch every stats poll) get their own path
+ELEPHANT_RATE = 1250000     # bytes per second (10 Mbit/s) above which a pair is moved (0 = never)
+ELEPHANT_PRIORITY = 15      # above policy/forwarding flows (10), below broadcast flows (20)
+ELEPHANT_IDLE_TIMEOUT = 10  # seconds without traffic before the pair falls back to its normal path
+
+# negative cache: drop flows for denied host pairs and unknown sources
+DROP_PRIORITY = 5           # above table-miss, below allowed flows (10)
+DROP_IDLE_TIMEOUT = 10      # seconds without matching packets before the drop flow expires
+DROP_HARD_TIMEOUT = 60      # seconds before the decision is re-evaluated by the controller
+
+# ARP handling
+ARP_PROXY = True            # reply to ARP requests for known IPs instead of flooding them
+ARP_FILTER_DENIED = False   # drop ARP between known hosts that may not communicate
+
 # class for SDN controller; extends SimpleSwitch13
 class SDNController(simple_switch_13.SimpleSwitch13):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]   # use OpenFlow 1.3
-    _CONTEXTS = {'stplib': stplib.Stp, 'wsgi': WSGIApplication}
+    _CONTEXTS = {'stplib': stplib.Stp, 'wsgi': WSGIApplication} if FORWARDING_MODE == 'stp' else {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super(SDNController, self).__init__(*args, **kwargs)
         self.mac_to_port = {}   # MAC learning table for each switch
-        self.stp = kwargs['stplib']
+        self.stp = kwargs.get('stplib')    # None unless FORWARDING_MODE is 'stp'
         self.datapaths = {}     # track active switches
-        self.hosts_info = {}    # hosts info received from gui.py
-        self.hosts_mac_list = []
-        self.communication_reqs = [] # application communication requirements
+        self.policy = PolicySnapshot()  # hosts info from gui.py + communication policy; replaced, never mutated
+        self.flow_epochs = set()    # policy epochs that have installed policy flows
+        self.ip_to_mac = {}     # IP address -> MAC address (from hosts info and ARP)
+        self.topology = TopologyGraph()  # switch graph built from link discovery, with cached shortest paths
+        self.installed_paths = {}    # (src host, dst host) -> [(dpid, port towards src, port towards dst)]
+        self.barrier_waiters = {}    # (dpid, xid) -> event set when the barrier reply arrives
+        self.flow_mirror = FlowMirror()  # flows installed on each switch
+        self.unmetered_datapaths = set()    # switches that rejected the packet-in meter
+        self.switch_ports = {}  # dpid -> set of port numbers (from topology discovery)
+        self.flood_groups = {}  # dpid -> ports in the switch's flood group (tree mode)
+        self.broadcast_rules = {}   # dpid -> {inter-switch port: True if on the spanning tree} (tree mode)
+        self.transit_ports = {}     # dpid -> inter-switch ports sent straight to the forwarding table (multi-table)
+        self.forwarding_rules = {}  # dpid -> {host MAC: output ports} in the forwarding table (multi-table)
+        self.ecmp_groups = {}   # dpid -> {output ports: SELECT group id} (ecmp + multi-table)
+        self.port_states = {}   # dpid -> {port: STP state name} (stp mode)
+
+        # packet-in admission: bounded queue per switch, drained round-robin by one worker
+        self.packet_in_queues = {}   # dpid -> deque of (key, event)
+        self.packet_in_pending = {}  # dpid -> keys of queued packet-ins (to coalesce duplicates)
+        self.admission_counters = {}    # dpid -> {'received', 'admitted', 'dropped', 'coalesced'}
+        self.admission_event = hub.Event()
+        self.admission_thread = hub.spawn(self._admission_loop)
+
+        # controller statistics and periodic switch stats polling
+        self.stats = ControllerStats()
+        self.stats_replies = {}     # (dpid, xid) -> stats entries of a multipart reply still arriving
+        self.stats_thread = hub.spawn(self._stats_loop)
+        self.traffic = TrafficMonitor()     # flow and port byte rates from the polled stats
+        self.elephant_paths = {}    # (src host, dst host) -> hops of the pair's elephant path (one direction)
+        self.journal = EventJournal(JOURNAL_SIZE, self.log_event if JOURNAL_LOG else None)
+        self.policy_gc_thread = hub.spawn(self._policy_gc_loop)
+
+        # restore the state of a previous run; flows are pushed again when switches reconnect
+        self.last_snapshot = None   # encoded state last written to SNAPSHOT_PATH
+        if SNAPSHOT_INTERVAL:
+            self.restore_snapshot()
+            self.snapshot_thread = hub.spawn(self._snapshot_loop)
+
+        # sharding: policy and links are exchanged with the other shards through the store
+        self.store = StoreClient(STORE_PATH) if SHARD_COUNT > 1 else None
+        self.store_version = 0      # store version up to which changes were fetched
+        self.links_key = f"links/{SHARD_INDEX}"   # store key of the link ends discovered by this shard
+        self.published = {}         # store key -> value this shard last published
+        self.published_epoch = self.policy.epoch
+        self.local_link_ends = {}   # (src dpid, src port) -> (dst dpid, dst port) discovered at this shard's switches
+        self.remote_lldp_seen = {}  # (src dpid, src port) of another shard's switch -> time of its last LLDP
+        self.remote_link_ends = {}  # store key -> link ends published by another shard
+        if self.store is not None:
+            self.store_thread = hub.spawn(self._store_sync_loop)
 
         # register REST API class to handle requests (HTTP)
         self.wsgi = kwargs['wsgi']
         self.wsgi.register(SDNRestController, {'controller_app': self})
 
-        # sample of stplib config
-        config = {dpid_lib.str_to_dpid('0000000000000001'):
-                {'bridge': {'priority': 0x8000}},
-                dpid_lib.str_to_dpid('0000000000000002'):
-                {'bridge': {'priority': 0x9000}},
-                dpid_lib.str_to_dpid('0000000000000003'):
-                {'bridge': {'priority': 0xa000}}}
-        self.stp.set_config(config)
+        # stplib defaults give every bridge the same priority, so the lowest dpid is the root on any topology
+
+    # function called by ryu-manager once every app is instantiated
+    def start(self):
+        self.trim_topology_app(app_manager.lookup_service_brick('switches'))
+        super(SDNController, self).start()
+
+    # function to limit Ryu's topology app to link discovery: hosts come from the registration API, so its host
+    # discovery handler (a full decode of every packet-in, outside the admission queue) is removed, and its
+    # LLDP handler (which also decodes every packet-in) only gets LLDP frames
+    def trim_topology_app(self, switches):
+        self.topology_app = switches
+        if switches is None:
+            return
+        switches.unregister_handler(ofp_event.EventOFPPacketIn, switches.host_discovery_packet_in_handler)
+        switches.unregister_handler(ofp_event.EventOFPPacketIn, switches.lldp_packet_in_handler)
+        switches.register_handler(ofp_event.EventOFPPacketIn, self.topology_lldp_packet_in)
+
+    # function to pass LLDP packet-ins on to the topology app's link discovery (runs on the topology app's thread)
+    def topology_lldp_packet_in(self, ev):
+        if parse_ethernet_header(ev.msg.data)[2] == ETH_TYPE_LLDP:
+            self.topology_app.lldp_packet_in_handler(ev)
 
     # function to delete flow when one container is shut down
     def delete_flow(self, datapath):
@@ -68,6 +252,141 @@ class SDNController(simple_switch_13.SimpleSwitch13):
         except Exception as e:
             self.logger.info(f"Error deleting flow in controller: {e}")
 
+    # function to add a flow; extends SimpleSwitch13.add_flow with cookie, timeouts, meter, goto table and the flow mirror
+    # returns False if an identical flow is already installed (no flow-mod is sent)
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None,
+                 cookie=0, idle_timeout=0, hard_timeout=0, table_id=0, meter_id=None, goto_table=None):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        inst_key = self.flow_mirror.instructions_key(actions, meter_id, goto_table)
+        if buffer_id is None and self.flow_mirror.is_installed(datapath.id, table_id, priority, match, cookie, inst_key):
+            return False
+
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)] if actions or goto_table is None else []
+        if meter_id is not None:
+            inst.insert(0, parser.OFPInstructionMeter(meter_id, ofproto.OFPIT_METER))
+        if goto_table is not None:
+            inst.append(parser.OFPInstructionGotoTable(goto_table))
+
+        # expiring flows report their removal so the mirror stays accurate
+        flags = ofproto.OFPFF_SEND_FLOW_REM if idle_timeout or hard_timeout else 0
+        if buffer_id:
+            mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id, cookie=cookie,
+                                    table_id=table_id, priority=priority, match=match, instructions=inst,
+                                    idle_timeout=idle_timeout, hard_timeout=hard_timeout, flags=flags)
+        else:
+            mod = parser.OFPFlowMod(datapath=datapath, cookie=cookie, table_id=table_id, priority=priority,
+                                    match=match, instructions=inst,
+                                    idle_timeout=idle_timeout, hard_timeout=hard_timeout, flags=flags)
+        datapath.send_msg(mod)
+        self.stats.count('flow_mods')
+        self.flow_mirror.record(datapath.id, table_id, priority, match, cookie, inst_key)
+        return True
+
+    # function to install a drop flow for denied IPv4 traffic (any destination if dst_mac is None)
+    def install_drop_flow(self, datapath, src_mac, dst_mac=None):
+        parser = datapath.ofproto_parser
+        if dst_mac is None:
+            match = parser.OFPMatch(eth_type=ETH_TYPE_IPV4, eth_src=src_mac)
+        else:
+            match = parser.OFPMatch(eth_type=ETH_TYPE_IPV4, eth_src=src_mac, eth_dst=dst_mac)
+        self.add_flow(datapath, DROP_PRIORITY, match, [], cookie=COOKIE_KIND_DROP,
+                      idle_timeout=DROP_IDLE_TIMEOUT, hard_timeout=DROP_HARD_TIMEOUT)
+
+    # function to remove drop flows on all switches (only those of a host pair if MACs are given)
+    # deletes are sent only to the switches the flow mirror shows holding a matching drop flow; returns those switches
+    def invalidate_drop_flows(self, src_mac=None, dst_mac=None):
+        if src_mac is None:
+            matches = [{}]
+        else:
+            matches = [{'eth_type': ETH_TYPE_IPV4, 'eth_src': src_mac, 'eth_dst': dst_mac},
+                       {'eth_type': ETH_TYPE_IPV4, 'eth_src': dst_mac, 'eth_dst': src_mac}]
+        touched = {}
+        for match_fields in matches:
+            datapaths = [datapath for dpid, datapath in self.datapaths.items()
+                         if self.flow_mirror.matching(dpid, COOKIE_KIND_DROP, COOKIE_KIND_MASK, match_fields)]
+            if datapaths:
+                self.delete_flows(COOKIE_KIND_DROP, COOKIE_KIND_MASK, match_fields or None, datapaths)
+                touched.update((datapath.id, datapath) for datapath in datapaths)
+        return list(touched.values())
+
+    # function to delete the flows whose cookie matches under cookie_mask, one message per switch
+    def delete_flows(self, cookie, cookie_mask, match_fields=None, datapaths=None):
+        datapaths = list(self.datapaths.values()) if datapaths is None else datapaths
+        for datapath in datapaths:
+            parser = datapath.ofproto_parser
+            ofproto = datapath.ofproto
+            mod = parser.OFPFlowMod(
+                datapath=datapath,
+                cookie=cookie,
+                cookie_mask=cookie_mask,
+                table_id=ofproto.OFPTT_ALL,
+                command=ofproto.OFPFC_DELETE,
+                out_port=ofproto.OFPP_ANY,
+                out_group=ofproto.OFPG_ANY,
+                match=parser.OFPMatch(**(match_fields or {}))
+            )
+            datapath.send_msg(mod)
+            self.stats.count('flow_mods')
+            self.flow_mirror.remove_matching(datapath.id, cookie, cookie_mask, match_fields or {})
+        return datapaths
+
+    # function to send a barrier to each switch and wait until they confirm; returns confirmed count
+    def wait_for_barriers(self, datapaths, timeout=BARRIER_TIMEOUT):
+        waiters = []
+        for datapath in datapaths:
+            req = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+            datapath.set_xid(req)
+            event = hub.Event()
+            self.barrier_waiters[(datapath.id, req.xid)] = event
+            waiters.append(((datapath.id, req.xid), event))
+            datapath.send_msg(req)
+
+        confirmed = 0
+        deadline = time.time() + timeout
+        for key, event in waiters:
+            if event.wait(timeout=max(deadline - time.time(), 0)):
+                confirmed += 1
+            self.barrier_waiters.pop(key, None)
+        return confirmed
+
+    # function to get the cookie bit of a host
+    def host_cookie_bit(self, host_name):
+        return 1 << (self.policy.host_index[host_name] % COOKIE_HOST_BITS)
+
+    # function to get the cookie of a policy (or elephant) flow between two MAC addresses
+    def policy_cookie(self, src_mac, dst_mac, kind=COOKIE_KIND_POLICY):
+        policy = self.policy
+        cookie = kind | self.epoch_cookie(policy.epoch)
+        for mac in (src_mac, dst_mac):
+            host_name = policy.mac_to_host.get(mac)
+            if host_name is not None:
+                cookie |= self.host_cookie_bit(host_name)
+        return cookie
+
+    # function to get the cookie bits of a policy epoch
+    @staticmethod
+    def epoch_cookie(epoch):
+        return (epoch & 0xffff) << COOKIE_GENERATION_SHIFT
+
+    # function to delete all policy flows of a host on every switch (one message per switch)
+    def delete_host_flows(self, host_name):
+        bit = self.host_cookie_bit(host_name)
+        datapaths = self.delete_flows(COOKIE_KIND_POLICY | bit, COOKIE_KIND_MASK | bit)
+
+        # hosts sharing the cookie bit lost their flows too; push their paths again
+        for (src_host_name, dst_host_name) in list(self.installed_paths):
+            if src_host_name < dst_host_name and host_name not in (src_host_name, dst_host_name) \
+                    and bit in (self.host_cookie_bit(src_host_name), self.host_cookie_bit(dst_host_name)):
+                self.install_path_flows(src_host_name, dst_host_name)
+        return datapaths
+
+    # function to delete all policy flows on every switch (one message per switch)
+    def delete_all_policy_flows(self):
+        self.remove_all_elephants()
+        return self.delete_flows(COOKIE_KIND_POLICY, COOKIE_KIND_MASK)
+
     # function to delete all flows
     def delete_all_flows(self):
         # iterate over all datapaths and delete flow
@@ -87,61 +406,894 @@ class SDNController(simple_switch_13.SimpleSwitch13):
 
     # function to check for allowed communication between hosts
     def is_communication_allowed(self, src_host_name, dst_host_name):
-        for req in self.communication_reqs:
-            if req["host"] == src_host_name and dst_host_name in req["dependencies"]:
-                return True
-            if req["host"] == dst_host_name and src_host_name in req["dependencies"]:
-                return True
-        return False
+        return self.policy.is_allowed(src_host_name, dst_host_name)
 
     # function to get host name by MAC address
     def get_host_name_by_mac(self, mac_addr):
-        for host in self.hosts_mac_list:
-            if host["mac"] == mac_addr:
-                return host["host_name"]
-        return None
+        return self.policy.mac_to_host.get(mac_addr)
+
+    # function to register hosts, resetting all communication requirements (starts a new base epoch)
+    def set_hosts(self, hosts):
+        self.remove_all_elephants()
+        self.policy = self.policy.with_hosts(hosts)
+        self.installed_paths.clear()
+        self.reset_host_addresses()
+        self.update_broadcast_tree()
+        self.update_forwarding()
+
+    # function to rebuild the address tables from the registered hosts, so addresses of hosts that are
+    # gone (or were restored from a snapshot) are not answered or forwarded to anymore
+    def reset_host_addresses(self):
+        self.ip_to_mac = dict((host['ip'], host['mac']) for host in self.policy.hosts_info.values() if host['ip'])
+        macs = set(host['mac'] for host in self.policy.hosts_info.values())
+        for mac_table in self.mac_to_port.values():
+            for mac in [mac for mac in mac_table if mac not in macs]:
+                del mac_table[mac]
+
+    # function to allow communication between a host and its dependencies; returns newly allowed peers
+    def add_communication(self, host_name, dependencies):
+        policy = self.policy
+        if host_name not in policy.communication_reqs:
+            return []
+
+        # extend dependencies instead of overwriting to avoid losing existing ones
+        host_deps = policy.communication_reqs[host_name]
+        communication_reqs = dict(policy.communication_reqs)
+        communication_reqs[host_name] = host_deps + tuple(dep for dep in dict.fromkeys(dependencies) if dep not in host_deps)
+        self.policy = policy.with_requirements(communication_reqs)
+        return sorted(self.policy.allowed_peers[host_name] - policy.allowed_peers[host_name])
+
+    # function to revoke all communication of a host; returns peers it could talk to
+    def remove_communication(self, host_name):
+        policy = self.policy
+        if host_name not in policy.allowed_peers:
+            return set()
+
+        # drop the host's dependencies and the host from everyone else's
+        communication_reqs = dict((name, tuple(dep for dep in deps if dep != host_name))
+                                  for name, deps in policy.communication_reqs.items())
+        communication_reqs[host_name] = ()
+        self.policy = policy.with_requirements(communication_reqs)
+
+        peers = policy.allowed_peers[host_name]
+        for peer in peers:
+            self.pop_pair_path(host_name, peer)
+        return peers
+
+    # function to revoke all communication between hosts
+    def clear_communication(self):
+        self.remove_all_elephants()
+        self.policy = self.policy.with_requirements({})
+        self.installed_paths.clear()
+
+    # function to forget the installed path of a host pair; returns its hops (None if no path was installed)
+    def pop_pair_path(self, host_name, peer):
+        self.remove_elephant(host_name, peer)
+        self.remove_elephant(peer, host_name)
+        self.installed_paths.pop((peer, host_name), None)
+        return self.installed_paths.pop((host_name, peer), None)
+
+    # function to replace all communication requirements with a complete dependency graph (host -> dependencies)
+    # only pairs whose state changes get flow-mods; returns the added and removed (host, host) pairs
+    def set_policy(self, policy_graph):
+        return self.apply_policy(self.policy.with_requirements(policy_graph))
+
+    # function to swap in a policy of the same host registration, changing only the flows of changed pairs
+    def apply_policy(self, new_policy):
+        old_policy = self.policy
+        self.policy = new_policy
+        current = set(pair for pair in old_policy.allowed_pairs if pair[0] < pair[1])
+        wanted = set(pair for pair in new_policy.allowed_pairs if pair[0] < pair[1])
+        hosts_info = new_policy.hosts_info
+
+        # added pairs first, so traffic moving from one pair to another is never without flows
+        # every switch that gets a flow-mod is returned, so the caller can barrier the whole update
+        added = sorted(wanted - current)
+        datapaths = {}
+        for host_name, peer in added:
+            for datapath in self.invalidate_drop_flows(hosts_info[host_name]['mac'], hosts_info[peer]['mac']):
+                datapaths[datapath.id] = datapath
+            for dpid, _, _ in self.install_path_flows(host_name, peer) or ():
+                if dpid in self.datapaths:
+                    datapaths[dpid] = self.datapaths[dpid]
+
+        # removed pairs: delete their flows only on the switches of their path (all switches if no path is known)
+        removed = sorted(current - wanted)
+        for host_name, peer in removed:
+            hops = self.pop_pair_path(host_name, peer)
+            if hops:
+                targets = [self.datapaths[dpid] for dpid, _, _ in hops if dpid in self.datapaths]
+            else:
+                targets = list(self.datapaths.values())
+            for datapath in targets:
+                self.delete_pair_flows(datapath, hosts_info[host_name]['mac'], hosts_info[peer]['mac'])
+                datapaths[datapath.id] = datapath
+        return added, removed, list(datapaths.values())
+
+    # function to delete, in the background, policy flows installed under an older host registration
+    def _policy_gc_loop(self):
+        while True:
+            hub.sleep(POLICY_GC_INTERVAL)
+            policy = self.policy
+            live = set(self.epoch_cookie(epoch) for epoch in self.flow_epochs if epoch >= policy.base_epoch)
+            live.add(self.epoch_cookie(policy.epoch))
+            for epoch in sorted(self.flow_epochs):
+                if epoch >= policy.base_epoch:
+                    continue
+                self.flow_epochs.discard(epoch)
+                # the epoch field wraps around; never delete flows a live epoch shares it with
+                if self.epoch_cookie(epoch) not in live:
+                    self.delete_flows(COOKIE_KIND_POLICY | self.epoch_cookie(epoch), COOKIE_KIND_MASK | COOKIE_GENERATION_MASK)
+                    self.logger.info(f"Removed policy flows of stale epoch {epoch}")
 
     # function to install flows for bidirectional communication
     def install_bidirectional_flows(self, datapath, src_mac, dst_mac, src_port, dst_port):
         parser = datapath.ofproto_parser
+        cookie = self.policy_cookie(src_mac, dst_mac)
+        self.flow_epochs.add(self.policy.epoch)
         
         # forward direction: src_mac -> dst_mac
         match_forward = parser.OFPMatch(eth_src=src_mac, eth_dst=dst_mac)
         actions_forward = [parser.OFPActionOutput(dst_port)]
-        self.add_flow(datapath, 10, match_forward, actions_forward)
-        self.logger.info(f"Installing forward flow: {src_mac} -> {dst_mac} out_port={dst_port}")
+        if self.add_flow(datapath, POLICY_PRIORITY, match_forward, actions_forward, cookie=cookie,
+                         idle_timeout=POLICY_IDLE_TIMEOUT, hard_timeout=POLICY_HARD_TIMEOUT):
+            self.journal.record(datapath.id, src_mac, dst_mac, 'flow-installed')
         
         # reverse direction: dst_mac -> src_mac
         match_reverse = parser.OFPMatch(eth_src=dst_mac, eth_dst=src_mac)
         actions_reverse = [parser.OFPActionOutput(src_port)]
-        self.add_flow(datapath, 10, match_reverse, actions_reverse)
+        self.add_flow(datapath, POLICY_PRIORITY, match_reverse, actions_reverse, cookie=cookie,
+                      idle_timeout=POLICY_IDLE_TIMEOUT, hard_timeout=POLICY_HARD_TIMEOUT)
+
+    # function to install a switch's part of a host pair's path (ports of the hop towards src and dst)
+    def install_hop_flows(self, datapath, src_host_name, dst_host_name, src_port, dst_port):
+        src_mac = self.policy.hosts_info[src_host_name]['mac']
+        dst_mac = self.policy.hosts_info[dst_host_name]['mac']
+        if not MULTI_TABLE:
+            self.install_bidirectional_flows(datapath, src_mac, dst_mac, src_port, dst_port)
+            return
+
+        # ACL entries only where a host of the pair is attached; forwarding entries are per host, not per pair
+        for host_name, mac, peer_mac in ((src_host_name, src_mac, dst_mac), (dst_host_name, dst_mac, src_mac)):
+            if self.policy.hosts_info[host_name]['dpid'] == datapath.id:
+                self.install_acl_flow(datapath, mac, peer_mac)
+        for host_name, mac in ((src_host_name, src_mac), (dst_host_name, dst_mac)):
+            ports = self.forwarding_ports(datapath.id, host_name)
+            if ports:
+                self.install_forwarding_flow(datapath, mac, ports)
+
+    # function to allow traffic from src_mac to dst_mac into the forwarding table (multi-table)
+    def install_acl_flow(self, datapath, src_mac, dst_mac):
+        parser = datapath.ofproto_parser
+        cookie = self.policy_cookie(src_mac, dst_mac)
+        self.flow_epochs.add(self.policy.epoch)
+        if self.add_flow(datapath, POLICY_PRIORITY, parser.OFPMatch(eth_src=src_mac, eth_dst=dst_mac), [],
+                         cookie=cookie, idle_timeout=POLICY_IDLE_TIMEOUT, hard_timeout=POLICY_HARD_TIMEOUT,
+                         table_id=ACL_TABLE, goto_table=FORWARDING_TABLE):
+            self.journal.record(datapath.id, src_mac, dst_mac, 'flow-installed')
+
+    # function to forward traffic for a MAC address out of a port, or spread it over several (multi-table)
+    def install_forwarding_flow(self, datapath, mac, ports):
+        parser = datapath.ofproto_parser
+        if len(ports) == 1:
+            actions = [parser.OFPActionOutput(ports[0])]
+        else:
+            actions = [parser.OFPActionGroup(self.ecmp_group(datapath, ports))]
+        self.add_flow(datapath, FORWARDING_PRIORITY, parser.OFPMatch(eth_dst=mac), actions,
+                      cookie=COOKIE_KIND_FORWARD, table_id=FORWARDING_TABLE)
+        self.forwarding_rules.setdefault(datapath.id, {})[mac] = ports
+
+    # function to get the SELECT group of a switch spreading traffic over ports, adding it if needed
+    def ecmp_group(self, datapath, ports):
+        groups = self.ecmp_groups.setdefault(datapath.id, {})
+        if ports not in groups:
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            used = set(groups.values())
+            group_id = next(group_id for group_id in itertools.count(ECMP_GROUP_BASE) if group_id not in used)
+            # watch_port lets the switch skip buckets whose port went down before the topology catches up
+            buckets = [parser.OFPBucket(weight=1, watch_port=port, actions=[parser.OFPActionOutput(port)])
+                       for port in ports]
+            datapath.send_msg(parser.OFPGroupMod(datapath, ofproto.OFPGC_ADD, ofproto.OFPGT_SELECT, group_id, buckets))
+            groups[ports] = group_id
+        return groups[ports]
+
+    # function to get the ports a switch forwards traffic for a host out of (all equal-cost next hops in ecmp mode)
+    def forwarding_ports(self, dpid, host_name):
+        host_dpid = self.policy.hosts_info[host_name]['dpid']
+        if FORWARDING_MODE != 'ecmp' or dpid == host_dpid:
+            port = self.forwarding_port(dpid, host_name)
+            return () if port is None else (port,)
+        next_hops = self.topology.next_hops(dpid, host_dpid)[:ECMP_MAX_PATHS]
+        return tuple(sorted(self.topology.get_port(dpid, neighbour) for neighbour in next_hops))
+
+    # function to get the port a switch forwards traffic for a host out of (next hop of its shortest path)
+    def forwarding_port(self, dpid, host_name):
+        host_dpid = self.policy.hosts_info[host_name]['dpid']
+        if dpid == host_dpid:
+            return self.get_host_port(host_name)
+        path = self.topology.shortest_path(dpid, host_dpid)
+        return self.topology.get_port(dpid, path[1]) if path else None
+
+    # function to bring transit and forwarding flows in line with the topology and the registered hosts (multi-table)
+    def update_forwarding(self):
+        if not MULTI_TABLE:
+            return
+
+        hosts_info = self.policy.hosts_info
+        for dpid, datapath in list(self.datapaths.items()):
+            parser = datapath.ofproto_parser
+
+            # packets from other switches already passed the ACL at their ingress switch
+            link_ports = self.topology.link_ports(dpid)
+            for port in self.transit_ports.get(dpid, set()) - link_ports:
+                self.delete_flows(COOKIE_KIND_FORWARD, COOKIE_KIND_MASK, {'in_port': port}, [datapath])
+            for port in link_ports:
+                self.add_flow(datapath, TRANSIT_PRIORITY, parser.OFPMatch(in_port=port), [],
+                              cookie=COOKIE_KIND_FORWARD, table_id=ACL_TABLE, goto_table=FORWARDING_TABLE)
+            self.transit_ports[dpid] = link_ports
+
+            # one forwarding entry per reachable host
+            wanted = {}
+            for host_name, host in hosts_info.items():
+                ports = self.forwarding_ports(dpid, host_name)
+                if ports:
+                    wanted[host['mac']] = ports
+            for mac in self.forwarding_rules.get(dpid, {}).keys() - wanted.keys():
+                self.delete_flows(COOKIE_KIND_FORWARD, COOKIE_KIND_MASK, {'eth_dst': mac}, [datapath])
+            self.forwarding_rules[dpid] = {}
+            for mac, ports in wanted.items():
+                self.install_forwarding_flow(datapath, mac, ports)
+
+            # groups no flow points to anymore (flows moved off them above)
+            groups = self.ecmp_groups.get(dpid, {})
+            for ports in groups.keys() - set(wanted.values()):
+                datapath.send_msg(parser.OFPGroupMod(datapath, datapath.ofproto.OFPGC_DELETE,
+                                                     datapath.ofproto.OFPGT_SELECT, groups.pop(ports)))
+
+    # function to get the switch port a host is attached to
+    def get_host_port(self, host_name):
+        host = self.policy.hosts_info[host_name]
+        if host.get('port') is not None:
+            return host['port']
+        return self.mac_to_port.get(host['dpid'], {}).get(host['mac'])
+
+    # function to pick the switch path between two switches (least loaded equal-cost path in ecmp mode)
+    def choose_path(self, src_dpid, dst_dpid):
+        # load-based choices depend on local state, so shards must all use the deterministic shortest path;
+        # per-destination forwarding (multi-table) spreads traffic with SELECT groups instead
+        if FORWARDING_MODE != 'ecmp' or self.store is not None or MULTI_TABLE:
+            return self.topology.shortest_path(src_dpid, dst_dpid)
+
+        paths = self.topology.equal_cost_paths(src_dpid, dst_dpid, ECMP_MAX_PATHS)
+        if len(paths) <= 1:
+            return paths[0] if paths else None
+        # fewest pairs on the busiest link first, then on all links; ties keep the first path
+        load = self.link_load()
+        best_path, best_cost = None, None
+        for path in paths:
+            loads = [load.get(tuple(sorted(edge)), 0) for edge in zip(path, path[1:])]
+            cost = (max(loads), sum(loads))
+            if best_cost is None or cost < best_cost:
+                best_path, best_cost = path, cost
+        return best_path
+
+    # function to count the installed host pairs using each inter-switch link
+    def link_load(self):
+        load = {}
+        for (src_host_name, dst_host_name), hops in self.installed_paths.items():
+            # every pair is stored in both directions; count it once
+            if src_host_name < dst_host_name:
+                for (a, _, _), (b, _, _) in zip(hops, hops[1:]):
+                    edge = tuple(sorted((a, b)))
+                    load[edge] = load.get(edge, 0) + 1
+        return load
+
+    # function to check if every link of installed hops still exists with the same ports
+    def hops_usable(self, hops):
+        for (a, _, out_port), (b, in_port, _) in zip(hops, hops[1:]):
+            if self.topology.get_port(a, b) != out_port or self.topology.get_port(b, a) != in_port:
+                return False
+        return True
+
+    # function to compute the hops (dpid, port towards src, port towards dst) between two hosts
+    def get_path_hops(self, src_host_name, dst_host_name):
+        src_host = self.policy.hosts_info[src_host_name]
+        dst_host = self.policy.hosts_info[dst_host_name]
+        path = self.choose_path(src_host['dpid'], dst_host['dpid'])
+        if path is None:
+            return None
+
+        hops = []
+        for i, dpid in enumerate(path):
+            if i == 0:
+                src_port = self.get_host_port(src_host_name)
+            else:
+                src_port = self.topology.get_port(dpid, path[i - 1])
+            if i == len(path) - 1:
+                dst_port = self.get_host_port(dst_host_name)
+            else:
+                dst_port = self.topology.get_port(dpid, path[i + 1])
+
+            # path not usable until both directions of every link and both host ports are known
+            if src_port is None or dst_port is None:
+                return None
+            hops.append((dpid, src_port, dst_port))
+        return hops
+
+    # function to install flows between two hosts on every switch along their path
+    def install_path_flows(self, src_host_name, dst_host_name):
+        hops = self.get_path_hops(src_host_name, dst_host_name)
+        src_host = self.policy.hosts_info[src_host_name]
+        dst_host = self.policy.hosts_info[dst_host_name]
+        if hops is None:
+            self.journal.record(src_host['dpid'], src_host['mac'], dst_host['mac'], 'no-path',
+                                (src_host_name, dst_host_name))
+            return None
+
+        for dpid, src_port, dst_port in hops:
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                # switches of other shards get their hops from their own shard
+                if self.store is not None:
+                    continue
+                return None
+            self.install_hop_flows(datapath, src_host_name, dst_host_name, src_port, dst_port)
+
+        # remember the path in both directions
+        self.installed_paths[(src_host_name, dst_host_name)] = hops
+        self.installed_paths[(dst_host_name, src_host_name)] = [
+            (dpid, dst_port, src_port) for dpid, src_port, dst_port in reversed(hops)]
+        self.journal.record(hops[0][0], src_host['mac'], dst_host['mac'], 'path-installed',
+                            (src_host_name, dst_host_name))
+        return hops
+
+    # function to answer an ARP request on behalf of the target host
+    def send_arp_reply(self, datapath, in_port, arp_req, target_mac):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        reply = packet.Packet()
+        reply.add_protocol(ethernet.ethernet(ethertype=ETH_TYPE_ARP, dst=arp_req.src_mac, src=target_mac))
+        reply.add_protocol(arp.arp(opcode=arp.ARP_REPLY,
+                                   src_mac=target_mac, src_ip=arp_req.dst_ip,
+                                   dst_mac=arp_req.src_mac, dst_ip=arp_req.src_ip))
+        reply.serialize()
+
+        out = parser.OFPPacketOut(
+            datapath=datapath,
+            buffer_id=ofproto.OFP_NO_BUFFER,
+            in_port=ofproto.OFPP_CONTROLLER,
+            actions=[parser.OFPActionOutput(in_port)],
+            data=reply.data
+        )
+        datapath.send_msg(out)
+
+    # function to delete the flows of a host pair on one switch
+    def delete_pair_flows(self, datapath, src_mac, dst_mac):
+        for src, dst in [(src_mac, dst_mac), (dst_mac, src_mac)]:
+            self.delete_flows(COOKIE_KIND_POLICY, COOKIE_KIND_MASK,
+                              {'eth_src': src, 'eth_dst': dst}, [datapath])
+
+    # function to move installed host paths whose switch path changed after a topology update
+    def reroute_paths(self, changed_switch_pairs):
+        # elephant paths over lost links fall back to the pair's normal path
+        for (src_host_name, dst_host_name), hops in list(self.elephant_paths.items()):
+            if not self.hops_usable(hops):
+                self.remove_elephant(src_host_name, dst_host_name)
+
+        for (src_host_name, dst_host_name), old_hops in list(self.installed_paths.items()):
+            # every pair is stored in both directions; handle it once
+            if src_host_name > dst_host_name:
+                continue
+            src_dpid = self.policy.hosts_info[src_host_name]['dpid']
+            dst_dpid = self.policy.hosts_info[dst_host_name]['dpid']
+            # an ecmp path may use a link that no cached shortest path uses, so also check the hops themselves;
+            # hops not confirmed by the topology yet (e.g. restored from a snapshot) stay until a path is known
+            if (src_dpid, dst_dpid) not in changed_switch_pairs and (dst_dpid, src_dpid) not in changed_switch_pairs \
+                    and (self.hops_usable(old_hops) or self.topology.shortest_path(src_dpid, dst_dpid) is None):
+                continue
+
+            del self.installed_paths[(src_host_name, dst_host_name)]
+            del self.installed_paths[(dst_host_name, src_host_name)]
+            new_hops = self.install_path_flows(src_host_name, dst_host_name) or []
+
+            # remove the pair's flows from switches that are no longer on its path
+            new_dpids = set(hop[0] for hop in new_hops)
+            src_mac = self.policy.hosts_info[src_host_name]['mac']
+            dst_mac = self.policy.hosts_info[dst_host_name]['mac']
+            for dpid, _, _ in old_hops:
+                if dpid not in new_dpids and dpid in self.datapaths:
+                    self.delete_pair_flows(self.datapaths[dpid], src_mac, dst_mac)
+            self.logger.info(f"Rerouted {src_host_name} <-> {dst_host_name}: {[hop[0] for hop in old_hops]} -> {[hop[0] for hop in new_hops]}")
+
+    # function to get the switches traffic from one host to another currently crosses (None if unknown)
+    def pair_switch_path(self, src_host_name, dst_host_name):
+        if not MULTI_TABLE:
+            hops = self.installed_paths.get((src_host_name, dst_host_name))
+            return [hop[0] for hop in hops] if hops else None
+
+        # per-destination forwarding: follow each switch's next hop towards the destination
+        dst_dpid = self.policy.hosts_info[dst_host_name]['dpid']
+        path = [self.policy.hosts_info[src_host_name]['dpid']]
+        while path[-1] != dst_dpid:
+            next_path = self.topology.shortest_path(path[-1], dst_dpid)
+            if not next_path or len(path) > len(self.topology.adjacency):
+                return None
+            path.append(next_path[1])
+        return path
+
+    # function to find pairs sending above ELEPHANT_RATE from this switch's hosts and move them if it helps
+    def detect_elephants(self, dpid):
+        policy = self.policy
+        pair_rates = self.traffic.pair_rates(dpid, (COOKIE_KIND_POLICY, COOKIE_KIND_ELEPHANT), COOKIE_KIND_MASK)
+        for (src_mac, dst_mac), rate in pair_rates.items():
+            if rate < ELEPHANT_RATE:
+                continue
+            src_host_name = policy.mac_to_host.get(src_mac)
+            dst_host_name = policy.mac_to_host.get(dst_mac)
+            # measured once, at the sender's switch; pairs already moved keep their path until it idles out
+            if src_host_name is None or dst_host_name is None or policy.hosts_info[src_host_name]['dpid'] != dpid \
+                    or (src_host_name, dst_host_name) in self.elephant_paths \
+                    or not policy.is_allowed(src_host_name, dst_host_name):
+                continue
+            self.reroute_elephant(src_host_name, dst_host_name, rate)
+
+    # function to move one direction of a host pair to the equal-cost path with the lowest link utilization
+    def reroute_elephant(self, src_host_name, dst_host_name, rate):
+        src_dpid = self.policy.hosts_info[src_host_name]['dpid']
+        dst_dpid = self.policy.hosts_info[dst_host_name]['dpid']
+        current = self.pair_switch_path(src_host_name, dst_host_name)
+        paths = self.topology.equal_cost_paths(src_dpid, dst_dpid, ECMP_MAX_PATHS)
+        if current is None or len(paths) <= 1:
+            return False
+
+        # busiest link of each path (transmit rate of the port leading to the next switch);
+        # the elephant's own traffic already loads its current path and would be added to any other
+        def busiest_link(path):
+            return max((self.traffic.port_rate(a, self.topology.get_port(a, b)) for a, b in zip(path, path[1:])), default=0.0)
+        best_path, best_cost = current, busiest_link(current)
+        for path in paths:
+            cost = busiest_link(path) + rate
+            if path != current and cost < best_cost:
+                best_path, best_cost = path, cost
+        if best_path == current:
+            return False
+
+        hops = []
+        for i, dpid in enumerate(best_path):
+            in_port = self.get_host_port(src_host_name) if i == 0 else self.topology.get_port(dpid, best_path[i - 1])
+            out_port = self.get_host_port(dst_host_name) if i == len(best_path) - 1 else self.topology.get_port(dpid, best_path[i + 1])
+            if in_port is None or out_port is None:
+                return False
+            hops.append((dpid, in_port, out_port))
+
+        # last switch first, so the sender's switch only diverts traffic once the rest of the path is in place
+        src_mac = self.policy.hosts_info[src_host_name]['mac']
+        dst_mac = self.policy.hosts_info[dst_host_name]['mac']
+        cookie = self.policy_cookie(src_mac, dst_mac, COOKIE_KIND_ELEPHANT)
+        for dpid, _, out_port in reversed(hops):
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue    # another shard's switch: its normal forwarding continues along the equal-cost path
+            parser = datapath.ofproto_parser
+            self.add_flow(datapath, ELEPHANT_PRIORITY, parser.OFPMatch(eth_src=src_mac, eth_dst=dst_mac),
+                          [parser.OFPActionOutput(out_port)], cookie=cookie, idle_timeout=ELEPHANT_IDLE_TIMEOUT,
+                          table_id=FORWARDING_TABLE if MULTI_TABLE else 0)
+        self.elephant_paths[(src_host_name, dst_host_name)] = hops
+        self.journal.record(src_dpid, src_mac, dst_mac, 'elephant-rerouted')
+        self.stats.count('elephant_reroutes')
+        self.logger.info(f"Elephant {src_host_name} -> {dst_host_name} ({rate * 8 / 1e6:.1f} Mbit/s): {current} -> {best_path}")
+        return True
+
+    # function to remove the elephant path of one direction of a host pair
+    def remove_elephant(self, src_host_name, dst_host_name):
+        hops = self.elephant_paths.pop((src_host_name, dst_host_name), None)
+        if hops is None:
+            return
+        match_fields = {'eth_src': self.policy.hosts_info[src_host_name]['mac'],
+                        'eth_dst': self.policy.hosts_info[dst_host_name]['mac']}
+        datapaths = [self.datapaths[dpid] for dpid, _, _ in hops if dpid in self.datapaths]
+        self.delete_flows(COOKIE_KIND_ELEPHANT, COOKIE_KIND_MASK, match_fields, datapaths)
 
+    # function to remove all elephant paths (one message per switch)
+    def remove_all_elephants(self):
+        if self.elephant_paths:
+            self.elephant_paths.clear()
+            self.delete_flows(COOKIE_KIND_ELEPHANT, COOKIE_KIND_MASK)
+
+    # function to install paths for allowed host pairs that have none yet (e.g. topology discovered late)
+    def install_pending_paths(self):
+        for src_host_name, dst_host_name in self.policy.allowed_pairs:
+            if src_host_name < dst_host_name and (src_host_name, dst_host_name) not in self.installed_paths:
+                self.install_path_flows(src_host_name, dst_host_name)
+
+    # function to get the actions flooding a packet received on in_port
+    def flood_actions(self, datapath, in_port):
+        parser = datapath.ofproto_parser
+        if FORWARDING_MODE == 'stp':
+            return [parser.OFPActionOutput(datapath.ofproto.OFPP_FLOOD)]
+
+        # flood along the spanning tree only; drop packets from inter-switch links off the tree and from
+        # ports not known to face a host (may be links LLDP has not discovered yet)
+        rules = self.broadcast_rules.get(datapath.id)
+        if rules is None:
+            return []
+        if in_port in rules:
+            return [parser.OFPActionGroup(FLOOD_GROUP_ID)] if rules[in_port] else []
+        if in_port not in self.flood_groups.get(datapath.id, ()):
+            return []
+        return [parser.OFPActionGroup(FLOOD_GROUP_ID)]
+
+    # function to bring flood groups and broadcast flows in line with the current spanning tree
+    def update_broadcast_tree(self):
+        if FORWARDING_MODE == 'stp':
+            return
+
+        tree_ports = self.topology.spanning_tree_ports()
+        host_ports = {}
+        for host_name, host in self.policy.hosts_info.items():
+            port = self.get_host_port(host_name)
+            if port is not None:
+                host_ports.setdefault(host['dpid'], set()).add(port)
+        for dpid, datapath in list(self.datapaths.items()):
+            if dpid not in self.switch_ports:
+                continue
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            link_ports = self.topology.link_ports(dpid)
+            on_tree = tree_ports.get(dpid, set())
+
+            # flood to the tree ports and the ports of registered hosts; other ports may be links LLDP has not
+            # discovered yet, and flooding to them would loop broadcasts on redundant topologies
+            flood_ports = tuple(sorted(on_tree | ((host_ports.get(dpid, set()) & self.switch_ports[dpid]) - link_ports)))
+            if self.flood_groups.get(dpid) != flood_ports:
+                command = ofproto.OFPGC_MODIFY if dpid in self.flood_groups else ofproto.OFPGC_ADD
+                buckets = [parser.OFPBucket(actions=[parser.OFPActionOutput(port)]) for port in flood_ports]
+                datapath.send_msg(parser.OFPGroupMod(datapath, command, ofproto.OFPGT_ALL, FLOOD_GROUP_ID, buckets))
+                self.flood_groups[dpid] = flood_ports
+                self.logger.info(f"Flood group of switch {dpid}: ports {list(flood_ports)}")
+
+            # broadcasts arriving over the tree are flooded by the switch, those from other links dropped;
+            # broadcasts from hosts still reach the controller (ARP proxy, learning)
+            rules = dict((port, port in on_tree) for port in link_ports)
+            for port in self.broadcast_rules.get(dpid, {}).keys() - rules.keys():
+                self.delete_flows(COOKIE_KIND_FLOOD, COOKIE_KIND_MASK,
+                                  {'in_port': port, 'eth_dst': BROADCAST_MAC}, [datapath])
+            for port, tree_port in rules.items():
+                actions = [parser.OFPActionGroup(FLOOD_GROUP_ID)] if tree_port else []
+                self.add_flow(datapath, FLOOD_PRIORITY, parser.OFPMatch(in_port=port, eth_dst=BROADCAST_MAC),
+                              actions, cookie=COOKIE_KIND_FLOOD)
+            self.broadcast_rules[dpid] = rules
+
+    # function to (re)install the path flows an already known path has on a switch (reconnect, warm restart)
+    def install_datapath_paths(self, datapath):
+        for (src_host_name, dst_host_name), hops in self.installed_paths.items():
+            if src_host_name > dst_host_name:
+                continue
+            for dpid, src_port, dst_port in hops:
+                if dpid == datapath.id:
+                    self.install_hop_flows(datapath, src_host_name, dst_host_name, src_port, dst_port)
+
+    # function to get the state needed to resume after a restart (JSON-serializable)
+    def snapshot_state(self):
+        return dict(self.policy_state(), **{
+            'flow_epochs': sorted(self.flow_epochs),
+            'installed_paths': sorted([src, dst, hops] for (src, dst), hops in self.installed_paths.items() if src < dst),
+            'ip_to_mac': self.ip_to_mac,
+            'mac_to_port': dict((str(dpid), table) for dpid, table in self.mac_to_port.items())
+        })
+
+    # function to get the policy as JSON-serializable state (snapshot file, shared store)
+    def policy_state(self):
+        policy = self.policy
+        return {
+            'epoch': policy.epoch,
+            'base_epoch': policy.base_epoch,
+            'hosts': [{'host': host_name, 'host_mac': host['mac'], 'dpid': format(host['dpid'], 'x'),
+                       'port': host['port'], 'ip': host['ip']}
+                      for host_name, host in policy.hosts_info.items()],
+            'communication_reqs': dict((host_name, list(deps)) for host_name, deps in policy.communication_reqs.items())
+        }
+
+    # function to build a policy snapshot from its state
+    @staticmethod
+    def policy_from_state(state):
+        return PolicySnapshot(state['epoch'], state['base_epoch'], parse_hosts(state['hosts']), state['communication_reqs'])
+
+    # function to load the snapshot of a previous run, if any
+    def restore_snapshot(self):
+        state, age = read_snapshot(SNAPSHOT_PATH)
+        if state is None:
+            return False
+        try:
+            # same epochs as before, so the installed flows keep their cookies and stale ones are still collected
+            self.policy = self.policy_from_state(state)
+            self.flow_epochs = set(state['flow_epochs'])
+            for src_host_name, dst_host_name, hops in state['installed_paths']:
+                hops = [tuple(hop) for hop in hops]
+                self.installed_paths[(src_host_name, dst_host_name)] = hops
+                self.installed_paths[(dst_host_name, src_host_name)] = [
+                    (dpid, dst_port, src_port) for dpid, src_port, dst_port in reversed(hops)]
+            self.ip_to_mac.update(state['ip_to_mac'])
+            self.mac_to_port.update((int(dpid), table) for dpid, table in state['mac_to_port'].items())
+        except (KeyError, TypeError, ValueError) as e:
+            self.logger.info(f"Ignoring unusable snapshot {SNAPSHOT_PATH}: {e}")
+            self.policy = PolicySnapshot()
+            self.installed_paths.clear()
+            return False
+
+        self.last_snapshot = encode_snapshot(self.snapshot_state())
+        self.logger.info(f"Restored {len(self.policy.hosts_info)} hosts and {len(self.installed_paths) // 2} paths "
+                         f"from a snapshot taken {age:.0f}s ago")
+        return True
+
+    # function to periodically write the state snapshot when it changed
+    def _snapshot_loop(self):
+        while True:
+            hub.sleep(SNAPSHOT_INTERVAL)
+            try:
+                encoded = encode_snapshot(self.snapshot_state())
+                if encoded != self.last_snapshot:
+                    write_snapshot(SNAPSHOT_PATH, encoded)
+                    self.last_snapshot = encoded
+            except Exception as e:
+                self.logger.error(f"Error writing state snapshot: {e}")
+
+    # function to exchange policy and links with the other shards
+    def _store_sync_loop(self):
+        while True:
+            hub.sleep(STORE_SYNC_INTERVAL)
+            try:
+                self.expire_remote_links()
+                self.publish(self.links_key, sorted([src, src_port, dst, dst_port] for (src, src_port), (dst, dst_port)
+                                                    in self.local_link_ends.items()))
+                if self.policy.epoch != self.published_epoch:
+                    self.publish('policy', self.policy_state())
+                    self.published_epoch = self.policy.epoch
+
+                self.store_version, items = self.store.changes(self.store_version)
+                for key, value in items.items():
+                    if key == 'policy':
+                        self.apply_remote_policy(value)
+                    elif key.startswith('links/') and key != self.links_key:
+                        self.apply_remote_links(key, value)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Error syncing with the shared store {STORE_PATH}: {e}")
+
+    # function to put a value into the store if it changed since this shard last published it
+    def publish(self, key, value):
+        if self.published.get(key) != value:
+            self.store.put(key, value)
+            self.published[key] = value
+
+    # function to take over a newer policy published by another shard
+    def apply_remote_policy(self, state):
+        if state['epoch'] <= self.policy.epoch:
+            return
+        new_policy = self.policy_from_state(state)
+        self.published_epoch = new_policy.epoch
+        if new_policy.base_epoch == self.policy.base_epoch:
+            self.apply_policy(new_policy)
+            return
+
+        # hosts were registered again; flows of the old registration are collected as a stale epoch
+        self.remove_all_elephants()
+        self.policy = new_policy
+        self.installed_paths.clear()
+        self.reset_host_addresses()
+        self.invalidate_drop_flows()
+        self.update_broadcast_tree()
+        self.update_forwarding()
+        self.install_pending_paths()
+
+    # function to replace the link ends published by another shard in the topology graph
+    def apply_remote_links(self, key, value):
+        old_ends = self.remote_link_ends.get(key, {})
+        new_ends = dict(((src, src_port), (dst, dst_port)) for src, src_port, dst, dst_port in value)
+        self.remote_link_ends[key] = new_ends
+
+        changed = set()
+        for link_end in old_ends.keys() - new_ends.keys():
+            changed |= self.topology.remove_link(*link_end)
+        for link_end, peer in new_ends.items():
+            if old_ends.get(link_end) != peer:
+                changed |= self.topology.add_link(link_end[0], link_end[1], peer[0], peer[1])
+        self.topology_changed(changed)
+
+    # function to learn a link from another shard's switch to this shard's switch (its LLDP arrives here)
+    def learn_remote_link(self, dpid, in_port, data):
+        try:
+            src_dpid, src_port = LLDPPacket.lldp_parse(data)
+        except LLDPPacket.LLDPUnknownFormat:
+            return
+        if src_dpid in self.datapaths:
+            return  # both ends are ours: reported by link discovery
+
+        link_end = (src_dpid, src_port)
+        self.remote_lldp_seen[link_end] = time.time()
+        if self.local_link_ends.get(link_end) != (dpid, in_port):
+            self.local_link_ends[link_end] = (dpid, in_port)
+            self.topology_changed(self.topology.add_link(src_dpid, src_port, dpid, in_port))
+
+    # function to forget links from other shards' switches whose LLDP stopped arriving
+    def expire_remote_links(self):
+        now = time.time()
+        changed = set()
+        expired = False
+        for link_end, seen in list(self.remote_lldp_seen.items()):
+            if now - seen > REMOTE_LINK_TIMEOUT:
+                del self.remote_lldp_seen[link_end]
+                self.local_link_ends.pop(link_end, None)
+                changed |= self.topology.remove_link(*link_end)
+                expired = True
+        if expired:
+            self.topology_changed(changed)
+
+    # function to update paths and flooding after the topology graph changed
+    def topology_changed(self, changed):
+        self.reroute_paths(changed)
+        self.update_broadcast_tree()
+        self.update_forwarding()
+        self.install_pending_paths()
+
+    # event handler to install the (metered) table-miss flow; overrides SimpleSwitch13's handler
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        datapath = ev.msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        # meter dropping packet-ins above the configured rate in the switch itself
+        meter_id = None
+        if PACKET_IN_METER_RATE and datapath.id not in self.unmetered_datapaths:
+            self.send_packet_in_meter(datapath, ofproto.OFPMC_ADD)
+            meter_id = PACKET_IN_METER_ID
+
+        match = parser.OFPMatch()
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+        self.add_flow(datapath, 0, match, actions, meter_id=meter_id)
+        if MULTI_TABLE:
+            self.add_flow(datapath, 0, match, actions, table_id=FORWARDING_TABLE, meter_id=meter_id)
+
+        # groups left over from a previous connection are rebuilt from the current tree
+        if FORWARDING_MODE != 'stp':
+            datapath.send_msg(parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE, 0, ofproto.OFPG_ALL))
+            self.ecmp_groups.pop(datapath.id, None)
+
+    # function to add (or modify) the meter limiting packet-ins of a switch
+    def send_packet_in_meter(self, datapath, command):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        bands = [parser.OFPMeterBandDrop(rate=PACKET_IN_METER_RATE, burst_size=PACKET_IN_METER_BURST)]
+        datapath.send_msg(parser.OFPMeterMod(datapath, command=command,
+                                             flags=ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST,
+                                             meter_id=PACKET_IN_METER_ID, bands=bands))
+
+    # event handler to fall back to an unmetered table-miss flow on switches without meter support
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _error_msg_handler(self, ev):
+        msg = ev.msg
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        if msg.type != ofproto.OFPET_METER_MOD_FAILED or datapath.id in self.unmetered_datapaths:
+            return
+
+        # meter left over from a previous connection: update it
+        if msg.code == ofproto.OFPMMFC_METER_EXISTS:
+            self.send_packet_in_meter(datapath, ofproto.OFPMC_MODIFY)
+            return
+
+        self.logger.info(f"Switch {datapath.id} rejected the packet-in meter, using an unmetered table-miss flow")
+        self.unmetered_datapaths.add(datapath.id)
+        parser = datapath.ofproto_parser
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+        self.add_flow(datapath, 0, parser.OFPMatch(), actions)
+        if MULTI_TABLE:
+            self.add_flow(datapath, 0, parser.OFPMatch(), actions, table_id=FORWARDING_TABLE)
+
+    # event handler to admit packet-ins into the bounded per-switch queue
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        counters = self.admission_counters.get(dpid)
+        if counters is None:
+            counters = self.admission_counters[dpid] = {'received': 0, 'admitted': 0, 'dropped': 0, 'coalesced': 0}
+            self.packet_in_queues[dpid] = deque()
+            self.packet_in_pending[dpid] = set()
+        counters['received'] += 1
+
+        # the same frame header from the same port is handled once (ARP also keyed by target IP)
+        data = msg.data
+        key = (msg.match['in_port'], bytes(data[:14]), bytes(data[38:42]) if data[12:14] == b'\x08\x06' else b'')
+        if key in self.packet_in_pending[dpid]:
+            counters['coalesced'] += 1
+            return
+        if len(self.packet_in_queues[dpid]) >= ADMISSION_QUEUE_SIZE:
+            counters['dropped'] += 1
+            return
+
+        self.packet_in_queues[dpid].append((key, ev))
+        self.packet_in_pending[dpid].add(key)
+        self.admission_event.set()
+
+    # function to drain the admission queues round-robin so one noisy switch cannot starve the others
+    def _admission_loop(self):
+        while True:
+            self.admission_event.wait()
+            self.admission_event.clear()
+            self.drain_admission_queues()
+
+    # function to handle every queued packet-in, one per switch in turn
+    def drain_admission_queues(self):
+        while any(self.packet_in_queues.values()):
+            for dpid, queue in list(self.packet_in_queues.items()):
+                # handling a packet-in may yield (full send queue), and the switch may disconnect meanwhile
+                if not queue or self.packet_in_queues.get(dpid) is not queue:
+                    continue
+                try:
+                    key, ev = queue.popleft()
+                    self.packet_in_pending[dpid].discard(key)
+                    self.admission_counters[dpid]['admitted'] += 1
+                    start = time.perf_counter()
+                    self.handle_packet_in(ev)
+                    self.stats.observe_packet_in(dpid, time.perf_counter() - start)
+                except Exception as e:
+                    # this thread serves every switch, so it must survive anything a single packet-in does
+                    self.logger.error(f"Error admitting packet-in from switch {dpid}: {e}")
+            hub.sleep(0)    # let other events (REST calls, switch messages) run
+
+    # function to handle an admitted packet-in
+    def handle_packet_in(self, ev):
         try:
             msg = ev.msg
             datapath = msg.datapath
-            self.datapaths[datapath.id] = datapath  # track datapath
+            # queued before the switch disconnected; its state is gone and must not be recreated
+            if self.datapaths.get(datapath.id) is not datapath:
+                return
             ofproto = datapath.ofproto
             parser = datapath.ofproto_parser
             in_port = msg.match['in_port']
+            policy = self.policy    # one consistent policy snapshot for the whole decision
 
-            pkt = packet.Packet(msg.data)
-            eth = pkt.get_protocols(ethernet.ethernet)[0]
-            src = eth.src
-            dst = eth.dst
+            # fast path: only the Ethernet header is read; deeper layers are parsed on demand
+            dst, src, eth_type = parse_ethernet_header(msg.data)
             dpid = datapath.id
+
+            # link discovery is handled by ryu's switches app; only links from other shards' switches are learned here
+            if eth_type == ETH_TYPE_LLDP:
+                if self.store is not None:
+                    self.learn_remote_link(dpid, in_port, msg.data)
+                return
             self.mac_to_port.setdefault(dpid, {})
-            eth_type = eth.ethertype
 
             # learn MAC to port mapping
             self.mac_to_port[dpid][src] = in_port
 
             # allow ARP packets
-            if eth_type == 0x0806:  # ARP
-                self.logger.debug("Processing ARP packet")
-                out_port = ofproto.OFPP_FLOOD
-                actions = [parser.OFPActionOutput(out_port)]
+            if eth_type == ETH_TYPE_ARP:
+                arp_pkt = packet.Packet(msg.data).get_protocol(arp.arp)
+                self.ip_to_mac[arp_pkt.src_ip] = arp_pkt.src_mac   # learn sender IP
+                target_mac = self.ip_to_mac.get(arp_pkt.dst_ip)
+
+                # optionally keep hosts that may not communicate from resolving each other
+                if ARP_FILTER_DENIED:
+                    src_host_name = policy.mac_to_host.get(arp_pkt.src_mac)
+                    dst_host_name = policy.mac_to_host.get(target_mac)
+                    if src_host_name and dst_host_name and not policy.is_allowed(src_host_name, dst_host_name):
+                        self.journal.record(dpid, arp_pkt.src_mac, target_mac, 'arp-denied')
+                        self.stats.count('dropped')
+                        return
+
+                # answer requests for known targets directly; flood only unknown targets
+                if ARP_PROXY and arp_pkt.opcode == arp.ARP_REQUEST and target_mac is not None:
+                    self.send_arp_reply(datapath, in_port, arp_pkt, target_mac)
+                    self.journal.record(dpid, arp_pkt.src_mac, target_mac, 'arp-reply')
+                    self.stats.count('arp_replies')
+                    return
+
+                actions = self.flood_actions(datapath, in_port)
                 out = parser.OFPPacketOut(
                     datapath=datapath,
                     buffer_id=ofproto.OFP_NO_BUFFER,
@@ -150,33 +1302,52 @@ class SDNController(simple_switch_13.SimpleSwitch13):
                     data=msg.data
                 )
                 datapath.send_msg(out)
+                self.journal.record(dpid, arp_pkt.src_mac, dst, 'arp-flood', arp_pkt.dst_ip)
+                self.stats.count('arp_floods')
                 return
 
             # handle IPv4 packets (including ICMP; ping)
-            if eth_type == 0x0800:
-                src_host_name = self.get_host_name_by_mac(src)
-                dst_host_name = self.get_host_name_by_mac(dst)
+            if eth_type == ETH_TYPE_IPV4:
+                src_host_name = policy.mac_to_host.get(src)
+                dst_host_name = policy.mac_to_host.get(dst)
 
-                # if either host unknown, drop packet gracefully (prevents crash)
+                # if either host unknown, drop packet gracefully (prevents crash) and cache the drop
                 if src_host_name is None or dst_host_name is None:
-                    self.logger.info(f"Unknown host for src={src} or dst={dst}, dropping packet.")
+                    self.journal.record(dpid, src, dst, 'unknown')
+                    self.install_drop_flow(datapath, src, None if src_host_name is None else dst)
+                    self.stats.count('dropped')
                     return
 
-                if self.is_communication_allowed(src_host_name, dst_host_name):
-                    self.logger.info(f"Allowing packet: {src_host_name} -> {dst_host_name}")
+                if policy.is_allowed(src_host_name, dst_host_name):
                     # learn source MAC port
                     self.mac_to_port[dpid][src] = in_port
 
-                    # install flow if output port for dst known
-                    if dst in self.mac_to_port[dpid]:
+                    # use the end-to-end path if it is known (installing it on first use)
+                    hops = self.installed_paths.get((src_host_name, dst_host_name))
+                    if hops is None:
+                        hops = self.install_path_flows(src_host_name, dst_host_name)
+                    if MULTI_TABLE and hops:
+                        # forwarding is per destination, so the packet may be on a switch off the pair's own path
+                        out_port = self.forwarding_port(dpid, dst_host_name)
+                        hop = None if out_port is None else (dpid, in_port, out_port)
+                    else:
+                        hop = next((hop for hop in hops if hop[0] == dpid), None) if hops else None
+
+                    if hop is not None:
+                        _, src_port, out_port = hop
+                        actions = [parser.OFPActionOutput(out_port)]
+                        self.journal.record(dpid, src, dst, 'allowed')
+                        # (re)install this switch's part of the path in case its flows were lost
+                        self.install_hop_flows(datapath, src_host_name, dst_host_name, src_port, out_port)
+                    # otherwise install flow if output port for dst known
+                    elif dst in self.mac_to_port[dpid]:
                         out_port = self.mac_to_port[dpid][dst]
                         actions = [parser.OFPActionOutput(out_port)]
                         self.install_bidirectional_flows(datapath, src, dst, in_port, out_port)
-                        self.logger.info(f"Flow installed: {src_host_name} <-> {dst_host_name}")
+                        self.journal.record(dpid, src, dst, 'learned')
                     else:
-                        out_port = ofproto.OFPP_FLOOD
-                        actions = [parser.OFPActionOutput(out_port)]
-                        self.logger.info(f"Flooding packet: {src_host_name} -> {dst_host_name}")
+                        actions = self.flood_actions(datapath, in_port)
+                        self.journal.record(dpid, src, dst, 'flooded')
 
                     # always send the current packet out
                     out = parser.OFPPacketOut(
@@ -188,14 +1359,220 @@ class SDNController(simple_switch_13.SimpleSwitch13):
                     )
                     datapath.send_msg(out)
                 else:
-                    # drop packet
-                    self.logger.info(f"Packet dropped: {src_host_name} -> {dst_host_name} (not allowed)")
+                    # drop packet and keep dropping the pair on the switch until the drop flow expires
+                    self.journal.record(dpid, src, dst, 'denied')
+                    self.install_drop_flow(datapath, src, dst)
+                    self.stats.count('dropped')
         except Exception as e:
-            self.logger.error(f"Exception in _packet_in_handler: {e}")
+            self.logger.error(f"Exception in handle_packet_in: {e}")
             import traceback
             traceback.print_exc()
 
-    # event handler to handle port change
+    # function to write a journal event to the log (optional journal sink)
+    def log_event(self, seq, timestamp, dpid, src, dst, verdict, detail):
+        self.logger.info("event %d: dpid=%s %s -> %s %s %s", seq, dpid, src, dst, verdict, format_detail(detail) or '')
+
+    # event handler to wake up REST calls waiting for deletions to be confirmed
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        event = self.barrier_waiters.get((ev.msg.datapath.id, ev.msg.xid))
+        if event is not None:
+            event.set()
+
+    # event handler to keep the flow mirror accurate when switches remove flows
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        # the mirror already forgot the flows the controller deleted; a late FlowRemoved(DELETE)
+        # may name a match that was reinstalled since
+        if msg.reason == msg.datapath.ofproto.OFPRR_DELETE:
+            return
+        cookie = self.flow_mirror.remove(dpid, msg.table_id, msg.priority, msg.match, msg.cookie)
+        if cookie is not None and (cookie & COOKIE_KIND_MASK) == COOKIE_KIND_ELEPHANT:
+            # the elephant went quiet: forget its path, the pair's normal flows carry it again
+            self.elephant_paths.pop((self.get_host_name_by_mac(msg.match.get('eth_src')),
+                                     self.get_host_name_by_mac(msg.match.get('eth_dst'))), None)
+            return
+        if cookie is None or (cookie & COOKIE_KIND_MASK) != COOKIE_KIND_POLICY:
+            return
+
+        # an expired policy flow breaks its pair's path: forget it so the next packet-in reinstalls it
+        src_host_name = self.get_host_name_by_mac(msg.match.get('eth_src'))
+        dst_host_name = self.get_host_name_by_mac(msg.match.get('eth_dst'))
+        self.installed_paths.pop((src_host_name, dst_host_name), None)
+        self.installed_paths.pop((dst_host_name, src_host_name), None)
+
+        # stop remembering the port of a MAC no flow on this switch refers to anymore
+        src_mac = msg.match.get('eth_src')
+        if not self.flow_mirror.uses_value(dpid, 'eth_src', src_mac) and not self.flow_mirror.uses_value(dpid, 'eth_dst', src_mac):
+            self.mac_to_port.get(dpid, {}).pop(src_mac, None)
+
+    # function to periodically request flow, port and meter stats from every switch
+    def _stats_loop(self):
+        while STATS_POLL_INTERVAL:
+            hub.sleep(STATS_POLL_INTERVAL)
+            self.stats.update_rates()
+            for dpid, datapath in list(self.datapaths.items()):
+                ofproto = datapath.ofproto
+                parser = datapath.ofproto_parser
+                datapath.send_msg(parser.OFPFlowStatsRequest(datapath, table_id=ofproto.OFPTT_ALL))
+                datapath.send_msg(parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY))
+                if PACKET_IN_METER_RATE and dpid not in self.unmetered_datapaths:
+                    datapath.send_msg(parser.OFPMeterStatsRequest(datapath, 0, ofproto.OFPM_ALL))
+
+    # function to collect the parts of a multipart stats reply; returns all entries once the last part arrived
+    def collect_stats_reply(self, msg):
+        key = (msg.datapath.id, msg.xid)
+        entries = self.stats_replies.setdefault(key, [])
+        entries.extend(msg.body)
+        if msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            return None
+        return self.stats_replies.pop(key)
+
+    # event handler to store the flow table counters of a switch
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        entries = self.collect_stats_reply(ev.msg)
+        if entries is None:
+            return
+        dpid = ev.msg.datapath.id
+        tables = {}
+        for stat in entries:
+            tables[stat.table_id] = tables.get(stat.table_id, 0) + 1
+        self.stats.set_switch_stats(dpid, 'flows', {
+            'flow_count': len(entries),
+            'mirrored': self.flow_mirror.occupancy(dpid),
+            'packet_count': sum(stat.packet_count for stat in entries),
+            'byte_count': sum(stat.byte_count for stat in entries),
+            'tables': {str(table_id): count for table_id, count in tables.items()}
+        })
+        self.traffic.update_flows(dpid, entries)
+        if ELEPHANT_RATE:
+            self.detect_elephants(dpid)
+
+    # event handler to store the port counters of a switch
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def _port_stats_reply_handler(self, ev):
+        entries = self.collect_stats_reply(ev.msg)
+        if entries is None:
+            return
+        self.stats.set_switch_stats(ev.msg.datapath.id, 'ports', {
+            str(stat.port_no): {
+                'rx_packets': stat.rx_packets, 'tx_packets': stat.tx_packets,
+                'rx_bytes': stat.rx_bytes, 'tx_bytes': stat.tx_bytes,
+                'rx_dropped': stat.rx_dropped, 'tx_dropped': stat.tx_dropped,
+                'rx_errors': stat.rx_errors, 'tx_errors': stat.tx_errors
+            }
+            for stat in entries if stat.port_no <= ev.msg.datapath.ofproto.OFPP_MAX
+        })
+        self.traffic.update_ports(ev.msg.datapath.id, entries)
+
+    # event handler to store the meter counters of a switch (packet-ins dropped by the packet-in meter)
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def _meter_stats_reply_handler(self, ev):
+        entries = self.collect_stats_reply(ev.msg)
+        if entries is None:
+            return
+        self.stats.set_switch_stats(ev.msg.datapath.id, 'meters', {
+            str(stat.meter_id): {
+                'packets': stat.packet_in_count,
+                'dropped_packets': sum(band.packet_band_count for band in stat.band_stats)
+            }
+            for stat in entries
+        })
+
+    # function to report whether host traffic can be forwarded: connected switches and, in stp mode, port states
+    def health(self):
+        forwarding = True
+        stp = {}
+        if FORWARDING_MODE == 'stp':
+            for dpid in self.datapaths:
+                states = self.port_states.get(dpid, {})
+                stp[str(dpid)] = {str(port): state for port, state in states.items()}
+                # ports only forward after the listen/learn phases
+                if not states or any(state in ('LISTEN', 'LEARN') for state in states.values()):
+                    forwarding = False
+        elif self.datapaths:
+            # the flood tree spans the switches once every one has a flood group and LLDP found links joining them
+            dpids = sorted(self.datapaths)
+            reachable = self.topology.dist.get(dpids[0], {})
+            forwarding = all(dpid in self.flood_groups and dpid in reachable for dpid in dpids)
+        return {
+            'shard': SHARD_INDEX,
+            'mode': FORWARDING_MODE,
+            'datapaths': sorted(self.datapaths),
+            'forwarding': forwarding,
+            'stp': stp
+        }
+
+    # event handler to track connected switches
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
+    def _state_change_handler(self, ev):
+        datapath = ev.datapath
+        if ev.state == MAIN_DISPATCHER:
+            self.datapaths[datapath.id] = datapath
+            self.topology.add_switch(datapath.id)
+            self.install_datapath_paths(datapath)
+            self.update_broadcast_tree()
+            self.update_forwarding()
+        elif ev.state == DEAD_DISPATCHER and datapath.id is not None:
+            self.datapaths.pop(datapath.id, None)
+            self.packet_in_queues.pop(datapath.id, None)
+            self.packet_in_pending.pop(datapath.id, None)
+            self.admission_counters.pop(datapath.id, None)
+            self.flow_mirror.clear(datapath.id)
+            self.mac_to_port.pop(datapath.id, None)
+            self.stats.remove_switch(datapath.id)
+            self.traffic.remove_switch(datapath.id)
+            self.switch_ports.pop(datapath.id, None)
+            self.flood_groups.pop(datapath.id, None)
+            self.broadcast_rules.pop(datapath.id, None)
+            self.transit_ports.pop(datapath.id, None)
+            self.forwarding_rules.pop(datapath.id, None)
+            self.ecmp_groups.pop(datapath.id, None)
+            self.port_states.pop(datapath.id, None)
+            self.reroute_paths(self.topology.remove_switch(datapath.id))
+            self.update_broadcast_tree()
+            self.update_forwarding()
+
+    # event handler to learn the ports of a discovered switch
+    @set_ev_cls(topo_event.EventSwitchEnter)
+    def _switch_enter_handler(self, ev):
+        switch = ev.switch
+        ofproto = switch.dp.ofproto
+        self.switch_ports[switch.dp.id] = set(port.port_no for port in switch.ports if port.port_no <= ofproto.OFPP_MAX)
+        self.update_broadcast_tree()
+
+    # event handler to track ports added to a switch
+    @set_ev_cls(topo_event.EventPortAdd)
+    def _port_add_handler(self, ev):
+        self.switch_ports.setdefault(ev.port.dpid, set()).add(ev.port.port_no)
+        self.update_broadcast_tree()
+
+    # event handler to track ports removed from a switch
+    @set_ev_cls(topo_event.EventPortDelete)
+    def _port_delete_handler(self, ev):
+        self.switch_ports.get(ev.port.dpid, set()).discard(ev.port.port_no)
+        self.update_broadcast_tree()
+
+    # event handler to add discovered links to the topology graph
+    @set_ev_cls(topo_event.EventLinkAdd)
+    def _link_add_handler(self, ev):
+        link = ev.link
+        self.local_link_ends[(link.src.dpid, link.src.port_no)] = (link.dst.dpid, link.dst.port_no)
+        self.topology_changed(self.topology.add_link(link.src.dpid, link.src.port_no, link.dst.dpid, link.dst.port_no))
+
+    # event handler to remove lost links from the topology graph
+    @set_ev_cls(topo_event.EventLinkDelete)
+    def _link_delete_handler(self, ev):
+        link = ev.link
+        self.local_link_ends.pop((link.src.dpid, link.src.port_no), None)
+        self.reroute_paths(self.topology.remove_link(link.src.dpid, link.src.port_no))
+        self.update_broadcast_tree()
+        self.update_forwarding()
+
+    # event handler to handle port change (stp mode)
     @set_ev_cls(stplib.EventPortStateChange, MAIN_DISPATCHER)
     def _port_state_change_handler(self, ev):
         dpid_str = dpid_lib.dpid_to_str(ev.dp.id)
@@ -206,6 +1583,14 @@ class SDNController(simple_switch_13.SimpleSwitch13):
                     stplib.PORT_STATE_FORWARD: 'FORWARD'}
         self.logger.debug("[dpid=%s][port=%d] state=%s",
                         dpid_str, ev.port_no, of_state[ev.port_state])
+        self.port_states.setdefault(ev.dp.id, {})[ev.port_no] = of_state[ev.port_state]
+
+        # only forwarding ports may carry host paths; reroute the paths affected by the change
+        blocked = ev.port_state != stplib.PORT_STATE_FORWARD
+        self.reroute_paths(self.topology.set_port_blocked(ev.dp.id, ev.port_no, blocked))
+        self.update_forwarding()
+        if not blocked:
+            self.install_pending_paths()
 
 
 # class for REST API communication between gui.py and SDN controller
@@ -220,29 +1605,15 @@ class SDNRestController(ControllerBase):
         try:
             request_body = req.json if req.body else {}
 
-            # clear previous host info to avoid duplicates/stale entries
-            self.controller_app.hosts_info.clear()
-            self.controller_app.hosts_mac_list.clear()
-            self.controller_app.communication_reqs.clear()
-
-            for host in request_body:
-                host_name = host['host']
-                # Use base 16 for DPID conversion (hexadecimal)
-                self.controller_app.hosts_info[host_name] = {
-                    'mac': host['host_mac'],
-                    'dpid': int(host['dpid'], 16)
-                }
+            # replace previous host info to avoid duplicates/stale entries
+            self.controller_app.set_hosts(request_body)
 
-                host_for_mac_list = {
-                    "host_name": host["host"],
-                    "mac": host["host_mac"]
-                }
-                self.controller_app.hosts_mac_list.append(host_for_mac_list)
-                host_for_reqs = { "host": host["host"], "dependencies": [] }
-                self.controller_app.communication_reqs.append(host_for_reqs)
+            # flows of the previous host registration are removed in the background (stale epoch);
+            # previously unknown MACs may be registered now
+            self.controller_app.invalidate_drop_flows()
 
             self.controller_app.logger.info(f"Registered {len(request_body)} hosts with controller")
-            self.controller_app.logger.info(f"hosts_mac_list: {[h['mac'] for h in self.controller_app.hosts_mac_list]}")
+            self.controller_app.logger.info(f"host MACs: {list(self.controller_app.policy.mac_to_host.keys())}")
             return Response(body="Hosts stored", status=200)
         except Exception as e: 
             print(f"Error sending host data to controller: {e}")
@@ -255,52 +1626,64 @@ class SDNRestController(ControllerBase):
             request_body = req.json if req.body else {}
 
             # populate communication_reqs dependencies
-            for host in self.controller_app.communication_reqs:
-                if host["host"] == request_body["host"]:
-                    # extend dependencies instead of overwriting to avoid losing existing ones
-                    for dep in request_body["dependencies"]:
-                        if dep not in host["dependencies"]:
-                            host["dependencies"].append(dep)
-                    self.controller_app.logger.info(f"Updated dependencies for {request_body['host']}: {host['dependencies']}")
+            host_name = request_body["host"]
+            if host_name in self.controller_app.policy.communication_reqs:
+                added = self.controller_app.add_communication(host_name, request_body["dependencies"])
+                policy = self.controller_app.policy
+                self.controller_app.logger.info(f"Updated dependencies for {host_name}: {list(policy.communication_reqs[host_name])}")
+
+                # push flows along the whole path so the first packet is not punted to the controller
+                host_mac = policy.hosts_info[host_name]['mac']
+                for dep in added:
+                    self.controller_app.invalidate_drop_flows(host_mac, policy.hosts_info[dep]['mac'])
+                    self.controller_app.install_path_flows(host_name, dep)
 
             return Response(body="Communication requirements added",status=200)
         except Exception as e: 
             print(f"Error adding communication requirements: {e}")
             return Response(body="Error adding flows", status=500)
 
+    # route to replace all communication requirements with the complete dependency graph {host: [dependencies]}
+    @route('simple_switch', '/policy', methods=['PUT'])
+    def put_policy(self, req, **kwargs):
+        try:
+            policy = req.json if req.body else {}
+            added, removed, datapaths = self.controller_app.set_policy(policy)
+            confirmed = self.controller_app.wait_for_barriers(datapaths)
+            self.controller_app.logger.info(f"Policy updated: {len(added)} pairs added, {len(removed)} removed")
+
+            result = {
+                'added': [list(pair) for pair in added],
+                'removed': [list(pair) for pair in removed],
+                'confirmed': confirmed,
+                'switches': len(datapaths)
+            }
+            return Response(status=200 if confirmed == len(datapaths) else 504, content_type='application/json',
+                            charset='utf-8', body=json.dumps(result))
+        except Exception as e:
+            return Response(status=500, body=f"Error updating policy: {e}")
+
     # route to delete flows when applications shut down
     @route('simple_switch', '/delete-flow', methods=['POST'])
     def delete_flow_route(self, req, **kwargs):
         try:
             body = req.json if req.body else {}
             host_del = body.get("host")
-            host_mac = self.controller_app.hosts_info.get(host_del, {}).get("mac")
+            host_mac = self.controller_app.policy.hosts_info.get(host_del, {}).get("mac")
             if not host_mac:
                 return Response(status=404, body=f"Host {host_del} not found")
 
             # remove host_del from all dependencies and clear its dependencies
-            for req in self.controller_app.communication_reqs:
-                if req["host"] == host_del:
-                    req["dependencies"] = []
-                if host_del in req["dependencies"]:
-                    req["dependencies"].remove(host_del)
-
-            # delete ALL flows for this host's MAC - packet-in will rebuild what's needed
-            for dpid, datapath in self.controller_app.datapaths.items():
-                parser = datapath.ofproto_parser
-                ofproto = datapath.ofproto
-                for match in [parser.OFPMatch(eth_src=host_mac), parser.OFPMatch(eth_dst=host_mac)]:                    
-                    mod = parser.OFPFlowMod(
-                        datapath=datapath,
-                        command=ofproto.OFPFC_DELETE,
-                        out_port=ofproto.OFPP_ANY,
-                        out_group=ofproto.OFPG_ANY,
-                        match=match
-                    )
-                    datapath.send_msg(mod)
-                self.controller_app.logger.info(f"Deleted all flows for MAC {host_mac} on switch DPID {dpid}")
-            
-            return Response(status=200, body="Flows deleted")
+            self.controller_app.remove_communication(host_del)
+            for mac_table in self.controller_app.mac_to_port.values():
+                mac_table.pop(host_mac, None)
+
+            # delete ALL flows tagged with this host's cookie bit - one message per switch
+            datapaths = self.controller_app.delete_host_flows(host_del)
+            confirmed = self.controller_app.wait_for_barriers(datapaths)
+            self.controller_app.logger.info(f"Deleted all flows for MAC {host_mac} on {confirmed}/{len(datapaths)} switches")
+
+            return self.deletion_response(confirmed, len(datapaths))
         except Exception as e:
             return Response(status=500, body=f"Error deleting flows: {e}")
 
@@ -308,16 +1691,92 @@ class SDNRestController(ControllerBase):
     @route('simple_switch', '/delete-all-flows', methods=['POST'])
     def delete_all_flows_route(self, req, **kwargs):
         try:
-            # instead of deleting all flows at once, delete flows for each active host using delete_flow_route logic
-            for host_name in list(self.controller_app.hosts_info.keys()):
-                # simulate request body for each host
-                fake_req = type('FakeReq', (), {'json': {'host': host_name}, 'body': True})()
-                self.delete_flow_route(fake_req)
-
             # remove communication reqs from all hosts
-            for req in self.controller_app.communication_reqs:
-                req["dependencies"] = []
+            self.controller_app.clear_communication()
+
+            # delete every policy flow at once - one message per switch
+            datapaths = self.controller_app.delete_all_policy_flows()
+            confirmed = self.controller_app.wait_for_barriers(datapaths)
+            self.controller_app.logger.info(f"Deleted all policy flows on {confirmed}/{len(datapaths)} switches")
 
-            return Response(body="All flows deleted", status=200)
+            return self.deletion_response(confirmed, len(datapaths))
+        except Exception as e:
+            return Response(body=f"Error deleting all flows: {e}", status=500)
+
+    # route to check readiness (used by network.py to wait for the controller instead of sleeping)
+    @route('simple_switch', '/health', methods=['GET'])
+    def health_route(self, req, **kwargs):
+        try:
+            return Response(content_type='application/json', charset='utf-8',
+                            body=json.dumps(self.controller_app.health()))
         except Exception as e:
-            return Response(body=f"Error deleting all flows: {e}", status=500)
\ No newline at end of file
+            return Response(status=500, body=f"Error getting health: {e}")
+
+    # route to get packet-in admission counters (to size the meter rate and queue length)
+    @route('simple_switch', '/admission-stats', methods=['GET'])
+    def admission_stats_route(self, req, **kwargs):
+        try:
+            app = self.controller_app
+            stats = {
+                'meter_rate': PACKET_IN_METER_RATE,
+                'meter_burst': PACKET_IN_METER_BURST,
+                'queue_size': ADMISSION_QUEUE_SIZE,
+                'switches': {
+                    str(dpid): dict(counters, queued=len(app.packet_in_queues.get(dpid, ())),
+                                    metered=dpid not in app.unmetered_datapaths)
+                    for dpid, counters in app.admission_counters.items()
+                }
+            }
+            return Response(content_type='application/json', charset='utf-8', body=json.dumps(stats))
+        except Exception as e:
+            return Response(status=500, body=f"Error getting admission stats: {e}")
+
+    # route to get controller statistics as JSON, or Prometheus text with ?format=prometheus
+    @route('simple_switch', '/stats', methods=['GET'])
+    def stats_route(self, req, **kwargs):
+        try:
+            app = self.controller_app
+            if req.params.get('format') == 'prometheus':
+                admission = {
+                    f"ngn_admission_{counter}_total": ('counter', f"Packet-ins {counter} by the admission queue",
+                                                       [({'dpid': dpid}, counters[counter])
+                                                        for dpid, counters in app.admission_counters.items()])
+                    for counter in ('received', 'admitted', 'dropped', 'coalesced')
+                }
+                admission['ngn_admission_queued'] = ('gauge', 'Packet-ins waiting in the admission queue',
+                                                     [({'dpid': dpid}, len(queue))
+                                                      for dpid, queue in app.packet_in_queues.items()])
+                return Response(content_type='text/plain', charset='utf-8',
+                                body=app.stats.to_prometheus(admission))
+
+            stats = app.stats.to_dict({
+                'admission': {str(dpid): dict(counters, queued=len(app.packet_in_queues.get(dpid, ())))
+                              for dpid, counters in app.admission_counters.items()},
+                'elephants': [{'src': src_host_name, 'dst': dst_host_name, 'path': [hop[0] for hop in hops]}
+                              for (src_host_name, dst_host_name), hops in app.elephant_paths.items()]
+            })
+            return Response(content_type='application/json', charset='utf-8', body=json.dumps(stats))
+        except Exception as e:
+            return Response(status=500, body=f"Error getting stats: {e}")
+
+    # route to get journal events with sequence number >= since (?since=<seq>&limit=<count>)
+    @route('simple_switch', '/events', methods=['GET'])
+    def events_route(self, req, **kwargs):
+        try:
+            journal = self.controller_app.journal
+            since = int(req.params.get('since', 0))
+            limit = int(req.params['limit']) if 'limit' in req.params else None
+            events = journal.since(since, limit)
+            body = {'next': events[-1]['seq'] + 1 if events else journal.next_seq,
+                    'events': events}
+            return Response(content_type='application/json', charset='utf-8', body=json.dumps(body))
+        except ValueError as e:
+            return Response(status=400, body=f"Invalid events query: {e}")
+        except Exception as e:
+            return Response(status=500, body=f"Error getting events: {e}")
+
+    # function to report whether every switch confirmed a deletion
+    def deletion_response(self, confirmed, total):
+        if confirmed < total:
+            return Response(status=504, body=f"Flows deleted, confirmed by {confirmed}/{total} switches")
+        return Response(status=200, body=f"Flows deleted, confirmed by {confirmed}/{total} switches")
\ No newline at end of file
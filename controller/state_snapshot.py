@@ -0,0 +1,36 @@
+'''
+What is this used for?
+1. Saves the controller state to a local file (compact, versioned JSON)
+2. Writes atomically so a crash never leaves a half-written snapshot
+3. Loads the snapshot on startup; unreadable or outdated snapshots are ignored
+'''
+
+import json
+import os
+import time
+
+SNAPSHOT_VERSION = 2    # bump when the layout of the saved state changes
+
+# function to serialize a state dict (compact, keys sorted so unchanged state gives identical output)
+def encode_snapshot(state):
+    return json.dumps({'version': SNAPSHOT_VERSION, 'state': state}, separators=(',', ':'), sort_keys=True)
+
+# function to write an encoded snapshot atomically (temporary file + rename)
+def write_snapshot(path, encoded):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# function to read a snapshot; returns (state, age in seconds) or (None, None) if missing, corrupt or outdated
+def read_snapshot(path):
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return None, None
+        return snapshot['state'], time.time() - os.path.getmtime(path)
+    except (OSError, ValueError, KeyError):
+        return None, None
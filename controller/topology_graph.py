@@ -0,0 +1,288 @@
+'''
+What is this used for?
+1. Keeps a model of the switch-level topology (switches + inter-switch links)
+2. Caches the shortest switch path between every pair of switches
+3. Recomputes cached paths incrementally, only for the pairs affected by a link change
+   (ties broken by the lowest predecessor dpid, so the cached paths depend only on the current graph)
+4. Computes a loop-free spanning tree for flooding broadcast traffic
+5. Lists the equal-cost shortest paths between two switches (multipath forwarding)
+'''
+
+from collections import deque
+
+# class for the switch graph discovered by the controller
+class TopologyGraph:
+    def __init__(self):
+        self.links = {}          # dpid -> {port: (peer dpid, peer port)}; every discovered link end
+        self.blocked_ports = set()  # (dpid, port) that may not forward traffic (e.g. STP BLOCK)
+        self.adjacency = {}      # dpid -> {neighbour dpid: local port}; links usable in both directions
+        self.dist = {}           # src dpid -> {dst dpid: hop count}
+        self.paths = {}          # src dpid -> {dst dpid: [dpids]}
+        self.edge_users = {}     # (dpid, dpid) -> {src: set of dst} of the cached paths that use the edge
+
+    # function to add a switch to the graph
+    def add_switch(self, dpid):
+        if dpid not in self.adjacency:
+            self.links[dpid] = {}
+            self.adjacency[dpid] = {}
+            self.dist[dpid] = {dpid: 0}
+            self.paths[dpid] = {dpid: [dpid]}
+
+    # function to remove a switch and all its links; returns the (src, dst) pairs whose path changed
+    def remove_switch(self, dpid):
+        if dpid not in self.adjacency:
+            return set()
+
+        changed = set()
+        for port in list(self.links[dpid]):
+            changed |= self.remove_link(dpid, port)
+        # links discovered from the neighbours' side end here too
+        for node in self.links:
+            for port, (peer, _) in list(self.links[node].items()):
+                if peer == dpid:
+                    changed |= self.remove_link(node, port)
+        self.blocked_ports = set(p for p in self.blocked_ports if p[0] != dpid)
+
+        # the switch is isolated now, so no cached path goes through it
+        del self.links[dpid]
+        del self.adjacency[dpid]
+        del self.dist[dpid]
+        del self.paths[dpid]
+        for src in self.dist:
+            self.dist[src].pop(dpid, None)
+            self.paths[src].pop(dpid, None)
+        return changed
+
+    # function to add a discovered link end; returns the (src, dst) pairs whose path changed
+    def add_link(self, src_dpid, src_port, dst_dpid, dst_port):
+        self.add_switch(src_dpid)
+        self.add_switch(dst_dpid)
+        self.links[src_dpid][src_port] = (dst_dpid, dst_port)
+        return self._update_edge(src_dpid, dst_dpid)
+
+    # function to remove a link end; returns the (src, dst) pairs whose path changed
+    def remove_link(self, src_dpid, src_port):
+        peer = self.links.get(src_dpid, {}).pop(src_port, None)
+        if peer is None:
+            return set()
+        return self._update_edge(src_dpid, peer[0])
+
+    # function to mark a port as (not) forwarding; returns the (src, dst) pairs whose path changed
+    def set_port_blocked(self, dpid, port, blocked):
+        if blocked == ((dpid, port) in self.blocked_ports):
+            return set()
+        if blocked:
+            self.blocked_ports.add((dpid, port))
+        else:
+            self.blocked_ports.discard((dpid, port))
+
+        peer = self.links.get(dpid, {}).get(port)
+        if peer is None:
+            return set()
+        return self._update_edge(dpid, peer[0])
+
+    # function to get the port of src_dpid leading to dst_dpid
+    def get_port(self, src_dpid, dst_dpid):
+        return self.adjacency.get(src_dpid, {}).get(dst_dpid)
+
+    # function to get the cached shortest switch path (list of dpids) between two switches
+    def shortest_path(self, src_dpid, dst_dpid):
+        return self.paths.get(src_dpid, {}).get(dst_dpid)
+
+    # function to list up to limit equal-cost shortest switch paths between two switches (in dpid order)
+    def equal_cost_paths(self, src_dpid, dst_dpid, limit=16):
+        to_dst = self.dist.get(dst_dpid, {})  # links are usable in both directions, so dst's row gives hops to dst
+        if src_dpid not in to_dst:
+            return []
+
+        paths = []
+        stack = [[src_dpid]]
+        while stack and len(paths) < limit:
+            path = stack.pop()
+            node = path[-1]
+            if node == dst_dpid:
+                paths.append(path)
+                continue
+            # pushed in reverse so the paths come out in dpid order
+            for neighbour in sorted(self.adjacency[node], reverse=True):
+                if to_dst.get(neighbour) == to_dst[node] - 1:
+                    stack.append(path + [neighbour])
+        return paths
+
+    # function to get the neighbours of src_dpid one hop closer to dst_dpid (next hops of all shortest paths, in dpid order)
+    def next_hops(self, src_dpid, dst_dpid):
+        to_dst = self.dist.get(dst_dpid, {})
+        if src_dpid not in to_dst:
+            return []
+        return [neighbour for neighbour in sorted(self.adjacency[src_dpid])
+                if to_dst.get(neighbour) == to_dst[src_dpid] - 1]
+
+    # function to get the local ports of a switch with a discovered link end (from either side)
+    def link_ports(self, dpid):
+        ports = set(self.links.get(dpid, {}))
+        for node, node_links in self.links.items():
+            for peer, peer_port in node_links.values():
+                if peer == dpid:
+                    ports.add(peer_port)
+        return ports
+
+    # function to compute a spanning tree (rooted at the lowest dpid of each component); returns dpid -> tree ports
+    def spanning_tree_ports(self):
+        tree_ports = dict((dpid, set()) for dpid in self.adjacency)
+        visited = set()
+        for root in sorted(self.adjacency):
+            if root in visited:
+                continue
+            _, previous = self._bfs(root)
+            for node, parent in previous.items():
+                visited.add(node)
+                if parent is not None:
+                    tree_ports[node].add(self.adjacency[node][parent])
+                    tree_ports[parent].add(self.adjacency[parent][node])
+        return tree_ports
+
+    # function to get the usable local port towards dst_dpid (both link ends discovered and forwarding)
+    def _usable_port(self, src_dpid, dst_dpid):
+        for port, (peer, _) in self.links.get(src_dpid, {}).items():
+            if peer == dst_dpid and (src_dpid, port) not in self.blocked_ports:
+                return port
+        return None
+
+    # function to (de)activate the edge between two switches after one of its link ends changed
+    def _update_edge(self, a, b):
+        port_ab = self._usable_port(a, b)
+        port_ba = self._usable_port(b, a)
+        active = port_ab is not None and port_ba is not None
+        was_active = b in self.adjacency.get(a, {})
+
+        if active:
+            self.adjacency[a][b] = port_ab
+            self.adjacency[b][a] = port_ba
+            return set() if was_active else self._edge_added(a, b)
+        if was_active:
+            del self.adjacency[a][b]
+            del self.adjacency[b][a]
+            return self._edge_removed(a, b)
+        return set()
+
+    # function to recompute the paths of the pairs that used a removed edge
+    def _edge_removed(self, a, b):
+        targets_by_src = self.edge_users.pop(self._edge_key(a, b), {})
+
+        # paths that did not use the edge are still shortest; only refresh the affected targets
+        for src, targets in targets_by_src.items():
+            self._refresh(src, targets)
+        return set((src, dst) for src, targets in targets_by_src.items() for dst in targets)
+
+    # function to update the paths that a new edge shortens or that now tie-break to it
+    def _edge_added(self, a, b):
+        changed = set()
+        for src in list(self.dist):
+            dist = self.dist[src]
+            if a not in dist and b not in dist:
+                continue
+            near, far = (a, b) if b not in dist or (a in dist and dist[a] < dist[b]) else (b, a)
+            hops = dist[near] + 1
+            # an edge between switches at the same distance from src is on no shortest path from src
+            if dist.get(far, hops) < hops:
+                continue
+
+            # switches the edge brings closer to src: BFS from the far endpoint, entering only switches it shortens
+            new_dist = {}
+            if dist.get(far, hops + 1) > hops:
+                new_dist[far] = hops
+                queue = deque([far])
+                while queue:
+                    node = queue.popleft()
+                    for neighbour in self.adjacency[node]:
+                        if neighbour not in new_dist and dist.get(neighbour, new_dist[node] + 2) > new_dist[node] + 1:
+                            new_dist[neighbour] = new_dist[node] + 1
+                            queue.append(neighbour)
+
+            # only those switches, their neighbours and the far endpoint can get another predecessor
+            candidates = set(new_dist)
+            candidates.add(far)
+            for node in new_dist:
+                candidates.update(self.adjacency[node])
+            roots = {}
+            for node in candidates:
+                node_hops = new_dist.get(node, dist.get(node))
+                if node == src or node_hops is None:
+                    continue
+                previous = min(neighbour for neighbour in self.adjacency[node]
+                               if new_dist.get(neighbour, dist.get(neighbour)) == node_hops - 1)
+                old_path = self.paths[src].get(node)
+                if old_path is None or old_path[-2] != previous:
+                    roots[node] = previous
+            if not roots:
+                continue
+
+            # a switch with a new predecessor moves its whole subtree of the old path tree along
+            targets = set(roots)
+            for node in roots:
+                old_path = self.paths[src].get(node)
+                if old_path is not None:
+                    targets |= self.edge_users[self._edge_key(old_path[-2], node)][src]
+
+            paths = {}
+            for dst in sorted(targets, key=lambda node: new_dist.get(node, dist.get(node))):
+                previous = roots[dst] if dst in roots else self.paths[src][dst][-2]
+                paths[dst] = (paths[previous] if previous in paths else self.paths[src][previous]) + [dst]
+            self._store(src, paths)
+            changed |= set((src, dst) for dst in targets)
+        return changed
+
+    # function to refresh the cached paths from src to the given targets
+    def _refresh(self, src, targets):
+        dist, previous = self._bfs(src)
+        self._store(src, dict((dst, self._path(previous, dst) if dst in dist else None) for dst in targets))
+
+    # function to store new paths from src (dst -> path, None if unreachable) and index the edges they use
+    def _store(self, src, paths):
+        for dst, path in paths.items():
+            old_path = self.paths[src].pop(dst, None)
+            self.dist[src].pop(dst, None)
+            if old_path:
+                for edge in zip(old_path, old_path[1:]):
+                    users = self.edge_users.get(self._edge_key(*edge), {}).get(src)
+                    if users:
+                        users.discard(dst)
+
+            if path is None:
+                continue
+            self.paths[src][dst] = path
+            self.dist[src][dst] = len(path) - 1
+            for edge in zip(path, path[1:]):
+                self.edge_users.setdefault(self._edge_key(*edge), {}).setdefault(src, set()).add(dst)
+
+    # function to get the path from the BFS root to dst by following predecessors
+    @staticmethod
+    def _path(previous, dst):
+        path = [dst]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return path
+
+    # function to run a breadth-first search from src over the usable edges
+    # each level is expanded in dpid order, so a switch's predecessor is its lowest-dpid neighbour one hop
+    # closer to src: a function of the graph alone, so paths do not depend on the order links were discovered in,
+    # and shards agree on them
+    def _bfs(self, src):
+        dist = {src: 0}
+        previous = {src: None}
+        level = [src]
+        while level:
+            next_level = []
+            for node in sorted(level):
+                for neighbour in self.adjacency[node]:
+                    if neighbour not in dist:
+                        dist[neighbour] = dist[node] + 1
+                        previous[neighbour] = node
+                        next_level.append(neighbour)
+            level = next_level
+        return dist, previous
+
+    @staticmethod
+    def _edge_key(a, b):
+        return (a, b) if a < b else (b, a)
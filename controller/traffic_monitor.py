@@ -0,0 +1,68 @@
+'''
+What is this used for?
+1. Turns the polled flow and port byte counters of every switch into rates (bytes per second)
+2. Flow rates find host pairs sending bulk traffic (elephant flows)
+3. Port rates estimate how loaded each inter-switch link is
+'''
+
+# class for byte rates computed from consecutive stats replies
+class TrafficMonitor:
+    def __init__(self):
+        self.flow_marks = {}    # dpid -> {(table id, priority, match key): (duration, byte count)}
+        self.flow_rates = {}    # dpid -> {(table id, priority, match key): (match fields, cookie, bytes/s)}
+        self.port_marks = {}    # dpid -> {port: (duration, tx bytes)}
+        self.port_rates = {}    # dpid -> {port: tx bytes/s}
+
+    # function to get a counter's rate between two samples (duration in seconds since the flow/port was created)
+    @staticmethod
+    def rate(previous, duration, count):
+        # no earlier sample, or the flow was replaced in between: average over its whole lifetime
+        if previous is None or duration <= previous[0] or count < previous[1]:
+            return count / duration if duration > 0 else 0.0
+        return (count - previous[1]) / (duration - previous[0])
+
+    # function to update the flow rates of a switch from a complete flow stats reply
+    def update_flows(self, dpid, entries):
+        marks = self.flow_marks.get(dpid, {})
+        new_marks = {}
+        rates = {}
+        for stat in entries:
+            match = dict(stat.match.items())
+            key = (stat.table_id, stat.priority, tuple(sorted(match.items())))
+            duration = stat.duration_sec + stat.duration_nsec / 1e9
+            rates[key] = (match, stat.cookie, self.rate(marks.get(key), duration, stat.byte_count))
+            new_marks[key] = (duration, stat.byte_count)
+        self.flow_marks[dpid] = new_marks
+        self.flow_rates[dpid] = rates
+
+    # function to update the transmit rates of a switch's ports from a complete port stats reply
+    def update_ports(self, dpid, entries):
+        marks = self.port_marks.get(dpid, {})
+        new_marks = {}
+        rates = {}
+        for stat in entries:
+            duration = stat.duration_sec + stat.duration_nsec / 1e9
+            rates[stat.port_no] = self.rate(marks.get(stat.port_no), duration, stat.tx_bytes)
+            new_marks[stat.port_no] = (duration, stat.tx_bytes)
+        self.port_marks[dpid] = new_marks
+        self.port_rates[dpid] = rates
+
+    # function to get the byte rate of each (eth_src, eth_dst) pair over the flows of a switch with a cookie kind
+    def pair_rates(self, dpid, cookie_kinds, cookie_mask):
+        pairs = {}
+        for match, cookie, rate in self.flow_rates.get(dpid, {}).values():
+            if (cookie & cookie_mask) in cookie_kinds and 'eth_src' in match and 'eth_dst' in match:
+                pair = (match['eth_src'], match['eth_dst'])
+                pairs[pair] = pairs.get(pair, 0.0) + rate
+        return pairs
+
+    # function to get the transmit rate of a port (0 if not polled yet)
+    def port_rate(self, dpid, port):
+        return self.port_rates.get(dpid, {}).get(port, 0.0)
+
+    # function to forget a disconnected switch
+    def remove_switch(self, dpid):
+        self.flow_marks.pop(dpid, None)
+        self.flow_rates.pop(dpid, None)
+        self.port_marks.pop(dpid, None)
+        self.port_rates.pop(dpid, None)
@@ -1,4 +1,3 @@
-import json
 import sys
 import os
 import time
@@ -11,10 +10,18 @@ from PyQt5.QtWidgets import (
     QGroupBox, QComboBox, QScrollArea, QFrame, QHBoxLayout, QDialog, QListWidget,
     QListWidgetItem,QDoubleSpinBox
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
 
 
 CONTROLLER_URL = 'http://localhost:8080'
+POLICY_TIMEOUT = 15     # seconds to wait for the controller to apply a policy (it waits for switch barriers)
+
+
+# class for signals carrying results of background NetworkManager work to the Qt thread
+class NetworkSignals(QObject):
+    progress = pyqtSignal(str)      # bring-up step
+    ready = pyqtSignal(list)        # host names, once topology and controller are up
+    failed = pyqtSignal(str)        # error message
 
 
 class MainWindow(QWidget):
@@ -27,8 +34,14 @@ class MainWindow(QWidget):
         self.containerDependencies = {}  # container dependencies
         self.containers_on_host = []
         self.isRunning=False
+        self.isStarting=False   # network bring-up running in the background
+        self.stopping=None      # future of a shutdown queued by the STOP button
         self.dependenciesConfirmed=False
         self.host_list=[]
+        self.signals = NetworkSignals()
+        self.signals.progress.connect(self.show_progress)
+        self.signals.ready.connect(self.network_ready)
+        self.signals.failed.connect(self.network_failed)
         self.initUI()
 
     def initUI(self):
@@ -92,6 +105,8 @@ class MainWindow(QWidget):
         self.stop = QPushButton("STOP")
         topoLayout.addWidget(self.run, 2, 0, 1, 1, Qt.AlignRight)
         topoLayout.addWidget(self.stop, 2, 2, 1, 1, Qt.AlignLeft)
+        self.statusLabel = QLabel("")
+        topoLayout.addWidget(self.statusLabel, 3, 0, 1, 3, Qt.AlignHCenter)
         topoGroupBox.setLayout(topoLayout)
         mainLayout.addWidget(topoGroupBox)
         ##TOPOLOGY FINISHED
@@ -181,17 +196,41 @@ class MainWindow(QWidget):
 
     def run_clicked(self):
         print("RUN button clicked")
-        self.isRunning=True
+        self.isStarting=True
         params = (
             self.switchesBox.value(),
             self.hostsBox.value(),
             self.linkProbBox.value()
         )
         print(f"Starting network with params: {params}")
-        self.nm.start_network_process(*params)
-        self.host_list = self.nm.get_hosts()
-        self.nm.start_controller()
-        self.add_hosts_to_controller()  # send list of active hosts to controller
+        self.updateEnables()
+
+        # bring-up runs in the background; the window stays responsive and is updated through signals
+        future = self.nm.start_async(*params, progress=self.signals.progress.emit)
+        future.add_done_callback(self.bring_up_done)
+
+    # function called on the background thread when bring-up finished
+    def bring_up_done(self, future):
+        try:
+            self.signals.ready.emit(future.result())
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+
+    def show_progress(self, message):
+        print(message)
+        self.statusLabel.setText(message)
+
+    def network_failed(self, message):
+        self.isStarting=False
+        self.show_progress(f"Network start failed: {message}")
+        self.updateEnables()
+
+    def network_ready(self, host_list):
+        self.isStarting=False
+        self.isRunning=True
+        self.host_list = host_list
+        self.show_progress("Network running")
+        self.nm.submit(self.add_hosts_to_controller)  # send list of active hosts to controller (in the background)
 
     #
         self.updateEnables()
@@ -205,25 +244,36 @@ class MainWindow(QWidget):
             self.isRunning=False
             self.dependenciesConfirmed=False
             self.stopAllContainers()
-            self.nm.shutdown()
+            self.stopping = self.nm.submit(self.nm.shutdown)  # after the containers are stopped
             self.updateEnables()
 
     def closeEvent(self, event):
         if self.isRunning:
             print("Window closing: Stopping network first")
-            self.stopAllContainers()
+            try:
+                self.stopAllContainers().result(timeout=POLICY_TIMEOUT)
+            except Exception as e:
+                print(f"Error stopping containers: {e}")
+        # a shutdown queued by the STOP button must still run: take it over if it has not started yet
+        if self.stopping is not None and not self.stopping.cancel():
+            self.stopping.result()
+        # abort a bring-up in progress and drop queued background calls, so closing does not wait for them
+        self.nm.close()
+        if self.isRunning or self.isStarting or (self.stopping is not None and self.stopping.cancelled()):
             self.nm.shutdown()
             self.isRunning = False
+            self.isStarting = False
         event.accept()
 
     def updateEnables(self):
         self.containerGroupBox.setEnabled(self.isRunning and self.dependenciesConfirmed)  
-        self.run.setEnabled(not self.isRunning)
+        idle = not self.isRunning and not self.isStarting
+        self.run.setEnabled(idle)
         self.stop.setEnabled(self.isRunning)
-        self.linkProbBox.setEnabled(not self.isRunning)
-        self.hostsBox.setEnabled(not self.isRunning)
-        self.switchesBox.setEnabled(not self.isRunning)
-        self.maxContainersBox.setEnabled(not self.isRunning)
+        self.linkProbBox.setEnabled(idle)
+        self.hostsBox.setEnabled(idle)
+        self.switchesBox.setEnabled(idle)
+        self.maxContainersBox.setEnabled(idle)
         self.dependencyGroupBox.setEnabled(self.isRunning and not self.dependenciesConfirmed)
 
     def updateLaunchButton(self):
@@ -281,21 +331,37 @@ class MainWindow(QWidget):
         self.runningContainers[container_id] = {"host": host, "container": container}
         self.hostContainerCounts[host] = self.hostContainerCounts.get(host,0) + 1
 
-        self.add_allowed_communication(host, container)
+        self.sync_policy()
         self.updateContainerDropdown()
         self.updateHostDropdown()
         self.updateMonitor()
         self.checkAutoDeploy()
 
+    # function to stop all containers; the stop, the flow deletion and the (now empty) policy are sent on the
+    # NetworkManager background thread, behind earlier policy updates, so none of those can re-allow stopped containers
     def stopAllContainers(self):
-        self.nm.stop_all_containers()
-        self.delete_allowed_communication(self.host_list)
+        self.nm.submit(self.stop_all_in_background, self.host_list)
         self.runningContainers = {}
         self.hostContainerCounts = {host: 0 for host in self.hostContainerCounts}
+        future = self.sync_policy()
         self.updateMonitor()
         self.updateContainerDropdown()
         self.updateHostDropdown()
         self.checkAutoDeploy()
+        return future
+
+    # function to stop all containers and delete their flows (runs on the NetworkManager background thread)
+    def stop_all_in_background(self, host_list):
+        try:
+            self.nm.stop_all_containers()
+        except Exception as e:
+            print(f"Error stopping containers: {e}")
+            self.signals.progress.emit(f"Error stopping containers: {e}")
+            return
+        if self.delete_allowed_communication(host_list):
+            self.signals.progress.emit("All containers stopped")
+        else:
+            self.signals.progress.emit("All containers stopped, deleting their flows failed")
 
     def updateMonitor(self):
         self.cleanMonitor()
@@ -327,11 +393,7 @@ class MainWindow(QWidget):
         if container_id in self.runningContainers:
             del self.runningContainers[container_id]
             self.hostContainerCounts[host] = self.hostContainerCounts.get(host) - 1
-            self.delete_allowed_communication(host) # now deletes all flows from this host
-            # Re-add allowed communication for all containers still running on this host
-            for cid, data in self.runningContainers.items():
-                if data['host'] == host:
-                    self.add_allowed_communication(host, data['container'])
+            self.sync_policy()  # controller only removes the flows of pairs no other container needs
             self.updateContainerDropdown()
             self.updateHostDropdown()
             self.updateMonitor()
@@ -465,10 +527,11 @@ class MainWindow(QWidget):
             self.nm.start_container(host, container)
             container_id = f"{container}_{host}"
             self.runningContainers[container_id] = {"host": host, "container": container}
-            self.add_allowed_communication(host, container)
             self.hostContainerCounts[host] = self.hostContainerCounts.get(host, 0) + 1
             time.sleep(0.5)
 
+        # one policy update for the whole deployment
+        self.sync_policy()
         self.updateMonitor()
         self.updateHostDropdown()
         self.updateContainerDropdown()
@@ -523,96 +586,65 @@ class MainWindow(QWidget):
 
     def get_host_info(self, host):
         try:
-            request = f"GET_HOST_INFO {host}"
-            self.nm.sock.send(request.encode())
-            data = self.nm.sock.recv(4096).decode()
-            return json.loads(data)
+            return self.nm.get_host_info(host)
         except Exception as e:
             print(f"Error fetching host info: {e}")
             return {}
 
-    # function to send list of (created) hosts to controller
+    # function to send list of (created) hosts to controller (runs on the NetworkManager background thread,
+    # after bring-up saw the controller healthy)
     def add_hosts_to_controller(self):
         try: 
             hosts_info_list = self.nm.get_hosts_mn_objects(self.host_list)
             print('host info', hosts_info_list)
-            time.sleep(10)   # wait for controller to start
             print('Sending list of active hosts to controller...')
-            response = requests.post(f"{CONTROLLER_URL}/post-hosts", json=hosts_info_list)
+            response = requests.post(f"{CONTROLLER_URL}/post-hosts", json=hosts_info_list, timeout=5)
+            response.raise_for_status()
+            self.signals.progress.emit("Hosts registered with the controller")
             print("Hosts sent to controller successfully.")
         except Exception as e:
-            print(f'Error sending hosts data to controller: {e}')    # function to send allowed communication rules to controller (called whenever a container is started, gets its dependencies)
-    def add_allowed_communication(self, host, container):
-        try:
-            communication_reqs = self.get_communication_reqs(container) #req = requirements
-            
-            # Also check if any running containers depend on this newly started container
-            reverse_deps = []
-            for running_container_id, running_data in self.runningContainers.items():
-                running_container = running_data["container"]
-                if running_container != container:  # Don't check against itself
-                    running_deps = self.containerDependencies.get(running_container, set())
-                    if container in running_deps:
-                        reverse_deps.append(running_data["host"])
-                        print(f"Found reverse dependency: {running_container} on {running_data['host']} depends on {container}")
-            
-            # Combine forward and reverse dependencies
-            all_deps = set(communication_reqs + reverse_deps)
-            
-            if not all_deps:
-                print(f"No communication dependencies found for {container}.")
-                return
-
-            host_info = self.nm.get_host_info(host)
-            if not host_info or "host" not in host_info:
-                raise ValueError(f"Host info missing or invalid for {host}")
-
-            dep_infos = []
-            for dep_host in all_deps:
-                dep_info = self.nm.get_host_info(dep_host)
-                if not dep_info or "host" not in dep_info:
-                    raise ValueError(f"Dependency host info invalid: {dep_host}")
-                dep_infos.append(dep_info)
-
-            hosts_communication = {
-                "host": host_info["host"],
-                "dependencies": [d["host"] for d in dep_infos]
-            }
-
-            response = requests.post(f"{CONTROLLER_URL}/add-communication", json=hosts_communication)
-            print(f"Allowed communication sent to controller successfully for {container} on {host}.")
-            
-            # Also update communication for reverse dependencies
-            for reverse_dep_host in reverse_deps:
-                reverse_host_info = self.nm.get_host_info(reverse_dep_host)
-                if reverse_host_info and "host" in reverse_host_info:
-                    reverse_communication = {
-                        "host": reverse_host_info["host"],
-                        "dependencies": [host_info["host"]]
-                    }
-                    response = requests.post(f"{CONTROLLER_URL}/add-communication", json=reverse_communication)
-                    print(f"Updated reverse communication for {reverse_dep_host} to include {host}.")
+            print(f'Error sending hosts data to controller: {e}')
+            self.signals.failed.emit(f"Registering hosts with the controller failed: {e}")
+
+    # function to get the complete host dependency graph {host: [hosts it depends on]} of the running containers
+    def get_policy(self):
+        policy = {host: set() for host in self.host_list}
+        for container_id, data in self.runningContainers.items():
+            dep_hosts = set(self.get_communication_reqs(data["container"])) - {data["host"]}
+            policy.setdefault(data["host"], set()).update(dep_hosts)
+        return {host: sorted(deps) for host, deps in policy.items()}
 
+    # function to send the complete host dependency graph to controller (called whenever containers start or stop)
+    # the request runs on the NetworkManager background thread, after host registration and earlier policy updates
+    def sync_policy(self):
+        return self.nm.submit(self.send_policy, self.get_policy())
+
+    def send_policy(self, policy):
+        try:
+            response = requests.put(f"{CONTROLLER_URL}/policy", json=policy, timeout=POLICY_TIMEOUT)
+            result = response.json()
+            print(f"Policy sent to controller: {len(result['added'])} pairs added, {len(result['removed'])} removed.")
         except Exception as e:
-            print(f"Error sending communication: {e}")
+            print(f"Error sending policy: {e}")
 
-    # function to delete flows upon application shutdown
+    # function to delete flows upon application shutdown; returns whether the controller confirmed the deletion
     def delete_allowed_communication(self, host):
         headers = {"Content-Type": "application/json"}
         try:
             # delete flow from one host
             if not isinstance(host, list):
-                response = requests.post(f"{CONTROLLER_URL}/delete-flow", json={"host": host}, headers=headers)
-                if response.status_code == 200:
-                    print("Deleted communication flows successfully.")
+                response = requests.post(f"{CONTROLLER_URL}/delete-flow", json={"host": host}, headers=headers,
+                                         timeout=POLICY_TIMEOUT)
             else:
                 # delete all flows if host is type list
-                response = requests.post(f"{CONTROLLER_URL}/delete-all-flows", headers=headers)
-                if response.status_code == 200:
-                    print("Deleted communication flows successfully.")
-
+                response = requests.post(f"{CONTROLLER_URL}/delete-all-flows", headers=headers, timeout=POLICY_TIMEOUT)
+            if response.status_code == 200:
+                print("Deleted communication flows successfully.")
+                return True
+            print(f"Error deleting communication: {response.status_code} {response.text}")
         except Exception as e:
             print(f"Error deleting communication: {e}")
+        return False
 
     def clear_all_dependencies(self):
         self.containerDependencies = {}
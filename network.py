@@ -1,8 +1,32 @@
+import glob
 import socket
 import subprocess
 import os
+import threading
 import time
-import json
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from topology.framing import FramedClient
+
+CONTROLLER_SHARDS = 1               # ryu-manager processes; switches are spread over them by dpid
+STORE_PATH = '/tmp/ngn_store.sock'  # Unix socket of the store shared by the controller shards
+OFP_PORT_BASE = 6633                # shard i listens for switches on OFP_PORT_BASE + i
+WSAPI_PORT_BASE = 8080              # shard i serves REST on WSAPI_PORT_BASE + i (the GUI talks to shard 0)
+TOPOLOGY_START_TIMEOUT = 90         # seconds for Mininet to start and announce READY (all switches connected)
+CONTROLLER_READY_TIMEOUT = 60       # seconds for the controller shards to report every switch forwarding (/health)
+STORE_START_TIMEOUT = 10            # seconds for the shared store to accept connections
+READY_POLL_INTERVAL = 0.5           # seconds between connection attempts / health checks
+SNAPSHOT_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'controller', 'controller_state*.json')
+
+# function to delete the controller state snapshots: they describe the hosts and paths of the previous topology
+def discard_controller_snapshots():
+    for path in glob.glob(SNAPSHOT_GLOB):
+        try:
+            os.remove(path)
+            print(f"Discarded controller snapshot {path}")
+        except OSError as e:
+            print(f"Could not discard controller snapshot {path}: {e}")
 
 def kill_previous_instances():
     try:
@@ -18,24 +42,49 @@ class NetworkManager:
     def __init__(self):
         self.net = None
         self.sock = None
+        self.client = None      # framed request/response client over self.sock
+        self.host_info_cache = None     # host name -> host info; fetched once per topology
         self.proc = None
-        self.controller_process= None
+        self.controller_processes = []
+        self.store_process = None
+        # background bring-up, host registration and policy updates; one worker so they run in submission order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cancelled = threading.Event()  # set to abort a bring-up in progress (window closed)
 
-    def start_controller(self):
-        print("Starting Ryu controller in a new xterm window")
-        cmd = [
-            "sudo",
-            "xterm",
-            "-hold",
-            "-e",
-            "ryu-manager",
-            "controller/simple_switch_stp_13.py"
-        ]
-        self.controller_process = subprocess.Popen(cmd)
+    # function to start the controller: one ryu-manager per shard, plus the shared store when sharded
+    def start_controller(self, shards=CONTROLLER_SHARDS):
+        if shards > 1:
+            print(f"Starting shared store for {shards} controller shards")
+            self.store_process = subprocess.Popen(["python3", "controller/shared_store.py", STORE_PATH])
+            self.wait_for_store()  # the shards connect to it on startup
+
+        for shard in range(shards):
+            print(f"Starting Ryu controller {shard} in a new xterm window")
+            cmd = [
+                "sudo",
+                "env",
+                f"NGN_SHARD_INDEX={shard}",
+                f"NGN_SHARD_COUNT={shards}",
+                f"NGN_STORE_PATH={STORE_PATH}",
+                "xterm",
+                "-hold",
+                "-e",
+                "ryu-manager",
+                "--observe-links",  # LLDP link discovery used for path computation
+                "--ofp-tcp-listen-port", str(OFP_PORT_BASE + shard),
+                "--wsapi-port", str(WSAPI_PORT_BASE + shard),
+                "controller/simple_switch_stp_13.py"
+            ]
+            self.controller_processes.append(subprocess.Popen(cmd))
         print("Ryu controller started in xterm successfully")
 
-    def start_network_process(self, num_switches, num_hosts, links_prob):
+    # function to start the topology process after cleaning up previous instances (does not wait for it)
+    def launch_topology(self, num_switches, num_hosts, links_prob, shards=CONTROLLER_SHARDS):
         kill_previous_instances()
+        # a new random topology has new MACs and links; the controller must not warm-restart into the old one
+        # (so warm restarts only apply to a controller restarted by hand while the network keeps running)
+        discard_controller_snapshots()
+        self.host_info_cache = None
         script_path = os.path.join(os.path.dirname(__file__), "topology/main.py")
         # Use a list for the command arguments instead of shell=True
         cmd = [
@@ -45,7 +94,8 @@ class NetworkManager:
             script_path,
             str(num_switches),
             str(num_hosts),
-            str(links_prob)
+            str(links_prob),
+            str(shards)     # switches are pointed at controller shard (dpid - 1) % shards
         ]
         print(f"Launching Xterm with command: {' '.join(cmd)}")
         
@@ -55,12 +105,100 @@ class NetworkManager:
         except Exception as e:
             print(f"Failed to launch Xterm: {e}")
             raise
-    
+
+    # function to wait until the shared store accepts connections (a stale socket file refuses them)
+    def wait_for_store(self, timeout=STORE_START_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            self.check_cancelled()
+            if self.store_process.poll() is not None:
+                raise RuntimeError("Shared store exited on startup")
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(STORE_PATH)
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Shared store not accepting connections within {timeout}s")
+                time.sleep(READY_POLL_INTERVAL / 10)
+            finally:
+                sock.close()
+
+    # function to connect to the topology's socket server and wait for its READY event; returns the event
+    def wait_for_topology(self, timeout=TOPOLOGY_START_TIMEOUT):
         print("Waiting for socket server to start")
-        time.sleep(5)  # Wait 5 seconds before attempting to connect
-        self._connect_to_socket()
+        deadline = time.monotonic() + timeout
+        self._connect_to_socket(deadline)
+        while True:
+            self.check_cancelled()
+            try:
+                ready = self.client.wait_event("READY", min(READY_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+                break
+            except TimeoutError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Topology not READY within {timeout}s")
+        if ready['connected'] < ready['switches']:
+            raise TimeoutError(f"Only {ready['connected']}/{ready['switches']} switches connected to the controller")
+        print(f"Topology ready: {ready['switches']} switches connected")
+        return ready
+
+    # function to wait until the controller shards together forward for all switches; returns their /health replies
+    def wait_for_controller(self, switches, shards=CONTROLLER_SHARDS, timeout=CONTROLLER_READY_TIMEOUT):
+        print("Waiting for controller")
+        deadline = time.monotonic() + timeout
+        while True:
+            self.check_cancelled()
+            try:
+                health = [requests.get(f"http://localhost:{WSAPI_PORT_BASE + shard}/health", timeout=2).json()
+                          for shard in range(shards)]
+                connected = sum(len(shard_health['datapaths']) for shard_health in health)
+                if connected >= switches and all(shard_health['forwarding'] for shard_health in health):
+                    print(f"Controller ready: {connected} switches forwarding")
+                    return health
+                status = f"{connected}/{switches} switches connected"
+            except requests.RequestException as e:
+                status = f"not answering: {e}"
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Controller not ready within {timeout}s ({status})")
+            time.sleep(READY_POLL_INTERVAL)
 
-    def _connect_to_socket(self):
+    # function to bring up topology and controller on a background thread; returns a Future of the host list
+    # progress(message) is called from that thread (e.g. a Qt signal's emit)
+    def start_async(self, num_switches, num_hosts, links_prob, shards=CONTROLLER_SHARDS, progress=print):
+        self.cancelled.clear()
+        return self.executor.submit(self._bring_up, num_switches, num_hosts, links_prob, shards, progress)
+
+    def _bring_up(self, num_switches, num_hosts, links_prob, shards, progress):
+        progress("Starting topology")
+        self.launch_topology(num_switches, num_hosts, links_prob, shards)
+        # the controller boots while Mininet builds the topology
+        progress("Starting controller")
+        self.start_controller(shards)
+        progress("Waiting for topology")
+        ready = self.wait_for_topology()
+        progress("Waiting for controller")
+        self.wait_for_controller(ready['switches'], shards)
+        progress("Fetching hosts")
+        hosts = self.get_hosts()
+        self.get_all_host_info()
+        return hosts
+
+    # function to run a call on the background thread; returns a Future
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    # function to abort the waits of a bring-up in progress
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise RuntimeError("Network start cancelled")
+
+    # function to stop background work: aborts a running bring-up and drops queued calls (window closing)
+    def close(self):
+        self.cancelled.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # function to connect to the topology's socket server, retrying until it listens or the deadline passes
+    def _connect_to_socket(self, deadline):
         print("Connecting to socket")
         # Close any existing socket first
         if self.sock:
@@ -68,57 +206,62 @@ class NetworkManager:
                 self.sock.close()
             except:
                 pass
-        
-        # Create a new socket
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        retries = 15  # Number of retries
-        for i in range(retries):
+
+        while True:
+            self.check_cancelled()
+            if self.proc and self.proc.poll() is not None:
+                raise RuntimeError("Topology process exited before its socket server started")
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             try:
                 self.sock.connect(('localhost', 9999))
+                self.client = FramedClient(self.sock)
                 print("Socket connected successfully!")
                 return
             except ConnectionRefusedError:
-                print(f"Socket not ready, retrying ({i+1}/{retries})")
-                time.sleep(3)  # Wait 3 seconds before retrying
-        raise ConnectionRefusedError("Failed to connect to socket after retries")
+                self.sock.close()
+                if time.monotonic() > deadline:
+                    raise ConnectionRefusedError("Socket server did not start in time")
+                time.sleep(READY_POLL_INTERVAL)
 
     def start_container(self, host_name, container_name):
         print("start container: ",host_name,container_name)
-        cmd = f"START_CONTAINER {host_name} {container_name}"
-        self.sock.send(cmd.encode())
-
-        response = self.sock.recv(1024).decode() #WAIT FOR ACK RESPONSE
+        response = self.client.request("START_CONTAINER", host=host_name, container=container_name)
         print(f"Container start response: {response}")
 
     def stop_container(self, host_name, container_name):
-        cmd = f"STOP_CONTAINER {host_name} {container_name}"
-        self.sock.send(cmd.encode())
+        return self.client.request("STOP_CONTAINER", host=host_name, container=container_name)
 
     def stop_all_containers(self):
-        cmd = "STOP_ALL"
-        self.sock.send(cmd.encode())
+        return self.client.request("STOP_ALL")
 
     def shutdown(self):
         try:
             # Stop the Ryu controller
-            if self.controller_process:
+            if self.controller_processes:
                 print("Stopping Ryu controller")
-                self.controller_process.terminate()
-                try:
-                    self.controller_process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    self.controller_process.kill()
-                self.controller_process = None
+                for process in self.controller_processes:
+                    process.terminate()
+                    try:
+                        process.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                self.controller_processes = []
                 subprocess.run(['sudo', 'pkill', '-f', 'ryu-manager'], stderr=subprocess.DEVNULL)
                 print("Ryu controller stopped.")
 
+            if self.store_process:
+                self.store_process.terminate()
+                self.store_process = None
+
             if self.sock: # Send a shutdown command to the topology generator
                 try:
-                    self.sock.send("SHUTDOWN".encode())
+                    self.client.send_request("SHUTDOWN")
                 except:
                     pass  # Ignore errors if the socket is already closed
                 self.sock.close()
                 self.sock = None
+                self.client = None
+                self.host_info_cache = None
                 
             # Kill the xterm process
             if self.proc:
@@ -137,38 +280,33 @@ class NetworkManager:
             print(f"Error during shutdown: {e}")
     
     def get_hosts(self): #GIVES BACK A FULL LIST OF HOST
-        self.sock.send("GET_HOSTS".encode())
-        data = self.sock.recv(4096).decode()
-        return data.split()  #Host names are space separated
+        return self.client.request("GET_HOSTS")
     
+    # function to get the info of all hosts (one request per topology; hosts do not change while it runs)
+    def get_all_host_info(self):
+        if self.host_info_cache is None:
+            self.host_info_cache = dict((host_info["host"], host_info) for host_info in self.client.request("GET_ALL_HOST_INFO"))
+        return self.host_info_cache
+
     def get_host_info(self, host_name):
-        self.sock.send(f"GET_HOST_INFO {host_name}".encode())
-        data = self.sock.recv(4096).decode()
-        return json.loads(data)
+        host_info = self.get_all_host_info().get(host_name)
+        if host_info is None:
+            raise KeyError(f"Host {host_name} not found")
+        return host_info
 
     # function to fetch mininet host info
     def get_hosts_mn_objects(self, hosts_list):
         try:
-            hosts_info = []
-
-            # iterate through hosts in list
-            for host in hosts_list:
-                # send request to socket server to get host info
-                request = f"GET_HOST_INFO {host}"
-                self.sock.send(request.encode())
-            
-                # get and decode json response
-                data = self.sock.recv(4096).decode()
-                host_info = json.loads(data)
+            hosts_info = [self.get_host_info(host) for host in hosts_list]
 
-                # validate data
-                required_keys = ["host", "host_mac", "dpid"]
+            # validate data
+            required_keys = ["host", "host_mac", "dpid"]
+            for host_info in hosts_info:
                 for key in required_keys:
                     if key not in host_info:
-                        raise ValueError(f"Missing '{key}' in host info response")
-                hosts_info.append(host_info)
+                        raise ValueError(f"Missing '{key}' in host info response for {host_info.get('host')}")
             return hosts_info
 
         except Exception as e:
-            print(f"Failed to get host info for {host}: {e}")
+            print(f"Failed to get host info: {e}")
             return None
@@ -0,0 +1,118 @@
+'''
+What is this used for?
+1. Framed request/response protocol between NetworkManager and the topology SocketServer
+2. Every message is a 4-byte big-endian length followed by that many bytes of JSON
+3. Requests carry an id that the reply echoes, so many requests can be in flight on one connection
+4. The server also pushes events without an id (e.g. READY once the network is usable)
+
+Request:  {"id": 7, "cmd": "GET_HOST_INFO", "args": {"host": "h1"}}
+Reply:    {"id": 7, "ok": true, "result": {...}}   or   {"id": 7, "ok": false, "error": "..."}
+Event:    {"event": "READY", "switches": 4, "connected": 4}
+'''
+
+# import libraries
+import json
+import itertools
+import select
+import struct
+import threading
+import time
+
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024   # bytes; larger frames mean a broken or foreign peer
+
+# class for errors reported by the other side of a framed connection
+class CommandError(RuntimeError):
+    pass
+
+# function to read exactly size bytes (None if the connection closed first)
+def recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+# function to encode one message as a frame
+def encode_frame(message):
+    payload = json.dumps(message).encode()
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+# function to send one message as a frame
+def send_frame(sock, message):
+    sock.sendall(encode_frame(message))
+
+# function to get the payload size from a frame header
+def frame_size(header):
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes exceeds the limit of {MAX_FRAME_SIZE}")
+    return size
+
+# function to receive one message (None if the connection closed)
+def recv_frame(sock):
+    header = recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    payload = recv_exact(sock, frame_size(header))
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+# class for the client side: sends requests and matches replies to them by id
+class FramedClient:
+    def __init__(self, sock):
+        self.sock = sock
+        self.ids = itertools.count(1)
+        self.replies = {}   # request id -> reply that arrived while waiting for another one
+        self.events = {}    # event name -> last pushed event message
+        self.send_lock = threading.Lock()
+        self.recv_lock = threading.Lock()
+
+    # function to send a request without waiting; returns its id
+    def send_request(self, cmd, **args):
+        request_id = next(self.ids)
+        with self.send_lock:
+            send_frame(self.sock, {'id': request_id, 'cmd': cmd, 'args': args})
+        return request_id
+
+    # function to receive one message and file it as a reply or an event (caller holds recv_lock)
+    def receive(self):
+        message = recv_frame(self.sock)
+        if message is None:
+            raise ConnectionError("Connection closed while waiting for a message")
+        if 'event' in message:
+            self.events[message['event']] = message
+        else:
+            self.replies[message.get('id')] = message
+
+    # function to wait for the reply to a request; returns its result or raises CommandError
+    def wait_reply(self, request_id):
+        with self.recv_lock:
+            while request_id not in self.replies:
+                self.receive()
+            reply = self.replies.pop(request_id)
+        if not reply.get('ok'):
+            raise CommandError(reply.get('error', 'unknown error'))
+        return reply.get('result')
+
+    # function to wait until the server pushed an event; returns the event message or raises TimeoutError
+    def wait_event(self, name, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.recv_lock:
+            while name not in self.events:
+                # only start reading once data is there, so a timeout never cuts a frame in half
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                readable, _, _ = select.select([self.sock], [], [], remaining)
+                if not readable:
+                    raise TimeoutError(f"No {name} event within {timeout}s")
+                self.receive()
+            return self.events[name]
+
+    # function to send a request and wait for its reply
+    def request(self, cmd, **args):
+        return self.wait_reply(self.send_request(cmd, **args))
+
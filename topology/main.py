@@ -5,6 +5,8 @@ What is this used for?
 3. Starts Mininet
 4. Launches socket server
 5. Runs CLI
+6. Optionally spreads the switches over several controller shards
+7. Tells socket clients when every switch is connected to its controller (READY)
 '''
 
 # import libraries
@@ -18,26 +20,43 @@ from mininet.cli import CLI
 from gen_topology import RandomTopo
 from socket_server import SocketServer
 
-# start a thread to handle incoming connections
-def handle_connections(server):
-    conn, addr = server.sock.accept()  # accept connection
-    print(f"Connection established with {addr}")
-    threading.Thread(target=server.handle_commands, args=(conn,)).start()
+OFP_PORT_BASE = 6633    # controller shard i listens on OFP_PORT_BASE + i
+CONNECT_TIMEOUT = 60    # seconds to wait for the switches to connect before announcing READY anyway
+
+# function to start the network with every switch connected only to its controller shard (dpid d -> shard (d - 1) % shards)
+# switches are started one by one with their own controller, so none ever registers at another shard
+def start_sharded_network(net, shards):
+    controllers = [net.addController(f'c{shard}', controller=RemoteController, ip='127.0.0.1', port=OFP_PORT_BASE + shard)
+                   for shard in range(shards)]
+    net.build()
+    for controller in controllers:
+        controller.start()
+    for switch in net.switches:
+        switch.start([controllers[(int(switch.dpid, 16) - 1) % shards]])
 
 # function to initialize topology with given parameters
-def start_topology_with_params(num_switches, num_hosts, links_prob):
+def start_topology_with_params(num_switches, num_hosts, links_prob, shards=1):
     # create mininet network
     print(f"Starting with parameters: switches={num_switches}, hosts={num_hosts}, link_prob={links_prob}")
     topo = RandomTopo()
     topo.build(num_switches, num_hosts, links_prob)
-    net = Mininet(topo=topo, controller=RemoteController('c1', ip='127.0.0.1', port=6633))
     print("Starting Mininet network")
-    net.start()
+    if shards > 1:
+        net = Mininet(topo=topo, controller=None, build=False)
+        start_sharded_network(net, shards)
+    else:
+        net = Mininet(topo=topo, controller=RemoteController('c1', ip='127.0.0.1', port=OFP_PORT_BASE))
+        net.start()
 
     server = SocketServer(net)
 
-    # start connection handler thread
-    threading.Thread(target=handle_connections, args=(server,)).start()
+    # serve clients (GUI, CLI tools, benchmarks) in the background while the CLI runs
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # READY carries how many switches made it, so clients can tell a timeout from success
+    if not net.waitConnected(timeout=CONNECT_TIMEOUT):
+        print(f"Not all switches connected within {CONNECT_TIMEOUT}s")
+    server.set_ready(len(net.switches), sum(1 for switch in net.switches if switch.connected()))
     
     print("Starting Mininet CLI")
     CLI(net)
@@ -45,11 +64,12 @@ def start_topology_with_params(num_switches, num_hosts, links_prob):
 
 # initialize program
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
+    if len(sys.argv) not in (4, 5):
         sys.exit(1)
 
     # received inputs
     num_switches = int(sys.argv[1])
     num_hosts = int(sys.argv[2])
     links_prob = float(sys.argv[3])
-    start_topology_with_params(num_switches, num_hosts, links_prob)
\ No newline at end of file
+    shards = int(sys.argv[4]) if len(sys.argv) == 5 else 1
+    start_topology_with_params(num_switches, num_hosts, links_prob, shards)
\ No newline at end of file
@@ -1,13 +1,26 @@
 '''
-What is this used for? 
+What is this used for?
 1. Creates a TCP socket (socket-based server)
-2. Listens to TCP commands (start/stop containers, etc.)
+2. Listens to framed JSON commands (start/stop containers, etc.; see framing.py)
 3. Performs actions on Mininet hosts / containers according to commands
+4. Answers every command with a reply carrying the request id
+5. Serves any number of clients at once on an asyncio event loop; commands run in a worker pool,
+   commands for the same host one at a time and in the order they arrived (STOP_ALL/SHUTDOWN touch every host)
+6. Pushes a READY event to every client once the network is usable (all switches connected)
 '''
 
+import asyncio
+import functools
+import json
 import socket
 import sys
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from framing import FRAME_HEADER, encode_frame, frame_size
+
+SOCKET_BACKLOG = 16         # pending connections
+WORKER_THREADS = 8          # commands (host.cmd calls) running at the same time
 
 class SocketServer:
     def __init__(self, net):
@@ -16,93 +29,193 @@ class SocketServer:
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.bind(('localhost', 9999))
-        self.sock.listen(1)
+        self.sock.listen(SOCKET_BACKLOG)
         print("Socket server listening on localhost:9999")
 
-    def handle_commands(self, conn):
-        while True:
-            try:
-                data = conn.recv(1024).decode()
-                if not data:
-                    break
-
-                if data.startswith("START_CONTAINER"):
-                    _, host, container = data.split()
-                    self.start_container(host, container)
-                    conn.send("CONTAINER_STARTED".encode())
-
-                elif data.startswith("STOP_CONTAINER"):
-                    _, host, container = data.split()
-                    self.stop_container(host, container)
-
-                elif data == "STOP_ALL":
-                    self.stop_all_containers()
-
-
-                elif data == "STOP_ALL":
-                    self.stop_all_containers()
-
-                elif data == "SHUTDOWN":
-                    print("Shutdown signal received")
-                    self.stop_all_containers()
-                    conn.close()
-                    self.sock.close()
-                    self.net.stop()
-                    sys.exit(0)
-
-                elif data == "GET_HOSTS":
-                    host_names = " ".join([host.name for host in self.net.hosts])
-                    conn.send(host_names.encode())
-
-                elif data.startswith("GET_HOST_INFO"):
-                    _, host_name = data.split()
-                    host = self.net.get(host_name)
-                    if host:
-                        try:
-                            host_mac = host.MAC()
-
-                            # get the first switch the host is connected to
-                            if host.intf().link:
-                                dpid = host.intf().link.intf2.node.dpid
-                            else:
-                                dpid = 0
-
-                            host_info = {
-                                "host": host_name,
-                                "host_mac": host_mac,
-                                "dpid": dpid
-                            }
-                            response = json.dumps(host_info)
-                            conn.send(response.encode())
-                        except Exception as e:
-                            error_msg = json.dumps({"error": f"Host info error: {e}"})
-                            conn.send(error_msg.encode())
-                    else:
-                        conn.send(json.dumps({"error": "Host not found"}).encode())
-
-            except Exception as e:
-                print(f"Socket command error: {e}")
-                break
-        conn.close()
-
-    def start_container(self, host_name, container_name):
-        host = self.net.get(host_name)
-        if host:
-            print(f"Starting application {container_name} on host {host_name}")
-
-            # run python script
-            host.cmd(f'sudo python3 apps/{container_name}.py > logs/{container_name}.log 2>&1 &')
-
-            # Track running container
-            if host_name not in self.running_containers:
-                self.running_containers[host_name] = set()
-            self.running_containers[host_name].add(container_name)
-
-    def stop_container(self, host_name, container_name):
-        host = self.net.get(host_name)
-        host.cmd(f"pkill -f {container_name}.py || true")
+        # command name -> function(**args) returning the reply result
+        self.commands = {
+            'START_CONTAINER': self.start_container,
+            'STOP_CONTAINER': self.stop_container,
+            'STOP_ALL': self.stop_all_containers,
+            'SHUTDOWN': self.stop_all_containers,
+            'GET_HOSTS': self.get_hosts,
+            'GET_HOST_INFO': self.get_host_info,
+            'GET_ALL_HOST_INFO': self.get_all_host_info
+        }
+        self.pool = ThreadPoolExecutor(max_workers=WORKER_THREADS)
+        self.host_tails = {}    # host name -> future done when the last command queued for the host finished
+        self.shutdown_event = None
+        self.clients = {}       # client writer -> its handler task
+        self.loop = None
+        self.loop_started = threading.Event()
+        self.ready = None       # READY event message, pushed to every client once set
+
+    # function to run the event loop until a client sends SHUTDOWN, then stop the network (blocks; run in a thread)
+    def serve_forever(self):
+        asyncio.run(self.serve())
+        self.pool.shutdown(wait=False)
+        self.net.stop()
+        sys.exit(0)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.shutdown_event = asyncio.Event()
+        self.loop_started.set()
+        server = await asyncio.start_server(self.handle_client, sock=self.sock)
+        async with server:
+            await self.shutdown_event.wait()
+
+            # close the clients before leaving the block: from Python 3.12.1 on, the server's
+            # wait_closed() on exit waits for every client connection to close
+            server.close()
+            for writer in list(self.clients):
+                writer.close()
+            if self.clients:
+                await asyncio.wait(list(self.clients.values()))
+
+    # function to read a client's requests; each request runs as its own task so slow ones do not block the rest
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        print(f"Connection established with {peer}")
+        self.clients[writer] = asyncio.current_task()
+        if self.ready:
+            writer.write(encode_frame(self.ready))
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                request = json.loads(await reader.readexactly(frame_size(header)))
+                task = asyncio.create_task(self.handle_request(request, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except asyncio.IncompleteReadError:
+            pass    # client closed the connection
+        except Exception as e:
+            print(f"Socket command error: {e}")
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+        del self.clients[writer]
+
+    # function to announce that the network is usable (called from the main thread)
+    def set_ready(self, switches, connected):
+        self.loop_started.wait()
+        self.loop.call_soon_threadsafe(self.push_ready, {'event': 'READY', 'switches': switches, 'connected': connected})
+
+    def push_ready(self, message):
+        self.ready = message
+        for writer in self.clients:
+            writer.write(encode_frame(message))
+
+    async def handle_request(self, request, writer, write_lock):
+        cmd = request.get('cmd')
+        args = request.get('args', {})
+        try:
+            if cmd not in self.commands:
+                raise ValueError(f"Unknown command {cmd}")
+            if cmd == "SHUTDOWN":
+                print("Shutdown signal received")
+            result = await self.run_command(cmd, args)
+            reply = {'id': request.get('id'), 'ok': True, 'result': result}
+        except Exception as e:
+            reply = {'id': request.get('id'), 'ok': False, 'error': f"{cmd} failed: {e}"}
+
+        try:
+            async with write_lock:
+                writer.write(encode_frame(reply))
+                await writer.drain()
+        finally:
+            # shut down even if the reply could not be delivered
+            if cmd == "SHUTDOWN":
+                self.shutdown_event.set()
+
+    # function to run a command in the worker pool once the earlier commands for the hosts it touches finished
+    async def run_command(self, cmd, args):
+        if 'host' in args:
+            host_names = [args['host']]
+        elif cmd in ('STOP_ALL', 'SHUTDOWN'):
+            host_names = sorted(host.name for host in self.net.hosts)
+        else:
+            host_names = []     # read-only commands
+
+        # queue behind every host at once (nothing is awaited in between), so a command touching
+        # all hosts keeps its arrival order against single-host commands sent after it
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        previous = {self.host_tails[host_name] for host_name in host_names if host_name in self.host_tails}
+        for host_name in host_names:
+            self.host_tails[host_name] = done
+        try:
+            if previous:
+                await asyncio.wait(previous)
+            return await loop.run_in_executor(self.pool, functools.partial(self.commands[cmd], **args))
+        finally:
+            done.set_result(None)
+            for host_name in host_names:
+                if self.host_tails.get(host_name) is done:
+                    del self.host_tails[host_name]
+
+    def start_container(self, host, container):
+        mn_host = self.net.get(host)
+        if not mn_host:
+            raise ValueError(f"Host {host} not found")
+        print(f"Starting application {container} on host {host}")
+
+        # run python script
+        mn_host.cmd(f'sudo python3 apps/{container}.py > logs/{container}.log 2>&1 &')
+
+        # Track running container
+        if host not in self.running_containers:
+            self.running_containers[host] = set()
+        self.running_containers[host].add(container)
+        return "CONTAINER_STARTED"
+
+    def stop_container(self, host, container):
+        mn_host = self.net.get(host)
+        if not mn_host:
+            raise ValueError(f"Host {host} not found")
+        mn_host.cmd(f"pkill -f {container}.py || true")
+        self.running_containers.get(host, set()).discard(container)
+        return "CONTAINER_STOPPED"
 
     def stop_all_containers(self):
         print("Stopping all Docker containers on all hosts")
         for host in self.net.hosts:
-            host.cmd("pkill -f flask || true")
\ No newline at end of file
+            host.cmd("pkill -f flask || true")
+        self.running_containers.clear()
+        return "ALL_STOPPED"
+
+    def get_hosts(self):
+        return [host.name for host in self.net.hosts]
+
+    # function to get a host's MAC, IP, interfaces and the switch (dpid, port) it is attached to
+    def get_host_info(self, host):
+        mn_host = self.net.get(host)
+        if not mn_host:
+            raise ValueError(f"Host {host} not found")
+
+        # get the first switch the host is connected to (and the switch port used)
+        if mn_host.intf().link:
+            switch_intf = mn_host.intf().link.intf2
+            dpid = switch_intf.node.dpid
+            port = switch_intf.node.ports[switch_intf]
+            switch_intf_name = switch_intf.name
+        else:
+            dpid = 0
+            port = None
+            switch_intf_name = None
+
+        return {
+            "host": host,
+            "host_mac": mn_host.MAC(),
+            "dpid": dpid,
+            "port": port,
+            "ip": mn_host.IP(),
+            "intf": mn_host.intf().name,
+            "switch_intf": switch_intf_name
+        }
+
+    # function to get the info of every host in one reply (same fields as GET_HOST_INFO)
+    def get_all_host_info(self):
+        return [self.get_host_info(host.name) for host in self.net.hosts]